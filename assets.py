@@ -0,0 +1,117 @@
+import io
+import os
+import threading
+
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Image
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # без Pillow картинки берутся из файлов как есть, без уменьшения
+    PILImage = None
+
+LOGO_PATH = "static/images/logo_black.png"
+STAMP_PATH = "static/images/stamp.png"
+
+# Шрифты с кириллицей в порядке предпочтения: (имя, обычный, жирный); иначе встроенный Helvetica
+FONT_CANDIDATES = [
+    ("Arial", "arial.ttf", "arialbd.ttf"),
+    ("DejaVuSans", "DejaVuSans.ttf", "DejaVuSans-Bold.ttf"),
+]
+# Логотип и печать выводятся не крупнее ~2 дюймов: большего разрешения документам не нужно,
+# а исходный логотип 1280x1280 каждый раз заново распаковывался и сжимался в PDF
+IMAGE_MAX_PX = 400
+
+
+class SharedImage(Image):
+    """Картинка для platypus над общим ImageReader: декодируется один раз на процесс"""
+
+    def __init__(self, reader, width, height, hAlign='CENTER'):
+        self._img = reader
+        super().__init__(io.BytesIO(), width=width, height=height, hAlign=hAlign)
+
+
+class DocumentAssets:
+    """
+    Шрифты и изображения бланков, общие для Excel, PDF, Word и чеков.
+    load() выполняется один раз при старте: шрифты регистрируются в reportlab,
+    логотип и печать читаются с диска, уменьшаются и держатся в памяти как PNG.
+    """
+
+    def __init__(self, image_paths: dict = None, image_max_px: int = IMAGE_MAX_PX):
+        self.image_paths = image_paths or {"logo": LOGO_PATH, "stamp": STAMP_PATH}
+        self.image_max_px = image_max_px
+        self.font_name = "Helvetica"
+        self.bold_font_name = "Helvetica-Bold"
+        self._images = {}
+        self._readers = {}
+
+    def load(self):
+        self._register_fonts()
+        for name, path in self.image_paths.items():
+            data = self._read_image(path)
+            if data is not None:
+                self._images[name] = data
+                self._readers[name] = ImageReader(io.BytesIO(data))
+        return self
+
+    def _register_fonts(self):
+        for name, regular, bold in FONT_CANDIDATES:
+            try:
+                pdfmetrics.registerFont(TTFont(name, regular))
+                pdfmetrics.registerFont(TTFont(f"{name}-Bold", bold))
+            except Exception:
+                continue
+            self.font_name = name
+            self.bold_font_name = f"{name}-Bold"
+            return
+        print("⚠️ Не найден шрифт с кириллицей, документы будут с Helvetica")
+
+    def _read_image(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        if PILImage is None or not self.image_max_px:
+            return data
+        try:
+            with PILImage.open(io.BytesIO(data)) as image:
+                if max(image.size) <= self.image_max_px:
+                    return data
+                image.thumbnail((self.image_max_px, self.image_max_px), PILImage.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG", optimize=True)
+                return buffer.getvalue()
+        except Exception as e:
+            print(f"⚠️ Не удалось уменьшить {path}: {e}")
+            return data
+
+    def image_bytes(self, name: str):
+        """PNG картинки или None, если файла нет"""
+        return self._images.get(name)
+
+    def image_stream(self, name: str):
+        """Новый поток с картинкой (python-docx и openpyxl читают и закрывают переданный файл)"""
+        data = self._images.get(name)
+        return io.BytesIO(data) if data is not None else None
+
+    def pdf_image(self, name: str, width, height, hAlign='CENTER'):
+        """Flowable для platypus или None, если картинки нет"""
+        reader = self._readers.get(name)
+        return SharedImage(reader, width, height, hAlign=hAlign) if reader is not None else None
+
+
+_assets = None
+_lock = threading.Lock()
+
+
+def get_assets() -> DocumentAssets:
+    """Общий реестр; при старте приложения загружается заранее, в остальных местах - при первом обращении"""
+    global _assets
+    if _assets is None:
+        with _lock:
+            if _assets is None:
+                _assets = DocumentAssets().load()
+    return _assets
@@ -1,11 +1,24 @@
+import os
+
 from fastapi import Request, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 
 from database import SessionLocal
+from bounded_pool import BoundedPool
 import models
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Стоимость bcrypt (2^rounds итераций); при изменении старые хеши пересчитываются при входе
+BCRYPT_ROUNDS = int(os.environ.get("QUEST_BCRYPT_ROUNDS", "12"))
+# bcrypt отпускает GIL, но занимает ядро на сотни мс: отдельный небольшой пул потоков,
+# чтобы вал входов не занимал общий threadpool и процессор целиком
+HASH_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+# Сколько хеширований может ждать и выполняться одновременно; сверх этого - отказ (503).
+# При 12 rounds (~0.3 с на хеш) это до ~5 с ожидания входа
+HASH_QUEUE_LIMIT = 16 * HASH_WORKERS
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+hash_pool = BoundedPool(workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT, kind="thread", name="bcrypt")
 
 
 # --- DB Session ---
@@ -26,6 +39,19 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+async def hash_password_async(password: str) -> str:
+    """hash_password в пуле bcrypt; очередь заполнена -> PoolBusy"""
+    return await hash_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str):
+    """
+    Проверка пароля в пуле bcrypt: (верен ли пароль, новый хеш или None).
+    Новый хеш возвращается, если старый посчитан с другим BCRYPT_ROUNDS - его нужно сохранить.
+    """
+    return await hash_pool.run(pwd_context.verify_and_update, plain, hashed)
+
+
 # --- Current user ---
 def get_current_user(request: Request, db: Session = Depends(get_db)):
     """Возвращает текущего пользователя по session['user_id']"""
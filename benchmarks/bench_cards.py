@@ -0,0 +1,101 @@
+"""
+Время рендера страницы карточек: прежний цикл в _quest_cards.html
+против склейки закэшированных фрагментов _quest_card.html.
+
+Запуск из корня проекта (база не нужна):
+    python benchmarks/bench_cards.py --cards 15 --runs 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Environment, FileSystemLoader
+
+from cache import quest_card_cache
+from fragments import render_quest_cards
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+# Сетка карточек в том виде, в каком она рендерилась до кэша фрагментов
+LEGACY_TEMPLATE = """<div class="cards-grid">
+  {% for quest in quests %}
+  <div class="card">
+    {% if quest.image_path %}
+    <img src="/static/{{ quest.image_path }}" alt="{{ quest.title }}" loading="lazy">
+    {% else %}
+    <div class="card-placeholder">🕵️‍♂️</div>
+    {% endif %}
+
+    <h4>{{ quest.title }}</h4>
+    <p class="meta">{{ quest.genre }} • {{ quest.difficulty }}</p>
+
+    <div class="price-card">
+      <span class="price">{{ quest.price }}₽</span>
+    </div>
+
+    <p class="desc">{{ quest.description[:110] }}{% if quest.description|length > 110 %}...{% endif %}</p>
+
+    <div class="card-actions">
+      <a href="/quest/{{ quest.id }}" class="btn">Подробнее</a>
+    </div>
+  </div>
+  {% endfor %}
+</div>"""
+
+
+def make_quests(count):
+    return [
+        SimpleNamespace(
+            id=i,
+            title=f"Квест <{i}> & побег",
+            genre="страшные, с актерами",
+            difficulty="сложный",
+            price=2500 + i,
+            description="Тёмный подвал, заброшенная больница и загадки. " * 5,
+            image_path=f"uploads/{i:032x}.png" if i % 2 else None,
+        )
+        for i in range(count)
+    ]
+
+
+def measure(render, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cards", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=True)
+    env.globals["render_quest_cards"] = lambda quests: render_quest_cards(env, quests)
+    quests = make_quests(args.cards)
+
+    legacy = env.from_string(LEGACY_TEMPLATE)
+    cached = env.from_string('<div class="cards-grid">\n  {{ render_quest_cards(quests) }}\n</div>')
+
+    quest_card_cache.clear()
+    cached.render(quests=quests)  # прогрев кэша карточек
+
+    for name, render in (
+        ("legacy loop", lambda: legacy.render(quests=quests)),
+        ("cached cards", lambda: cached.render(quests=quests)),
+    ):
+        median, p99 = measure(render, args.runs)
+        print(f"{name:<13} median={median:8.1f} us  p99={p99:8.1f} us  ({args.cards} cards)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Время на один документ: загрузка шрифтов и картинок на каждый запрос (как было)
+против общего реестра assets.py, загруженного один раз при старте.
+
+"Как было" эмулируется новым DocumentAssets на каждый документ: шрифты заново
+разбираются из TTF, логотип и печать читаются с диска в исходном размере.
+
+Запуск из корня проекта (база не нужна):
+    python benchmarks/bench_documents.py --requests 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assets
+import documents
+import reports
+
+ROWS = [(f"user{i}", f"user{i}@example.com", f"Квест {i % 15}", "org@example.com", 2500) for i in range(20)]
+
+DOCUMENTS = {
+    "receipt": lambda: documents._render_receipt_full(documents._receipt_lines("Квест", 2500, "bench")),
+    "letterhead": lambda: documents.render_receipt("Квест", 2500, "bench"),
+    "report pdf": lambda: reports.build_bookings_pdf(iter(ROWS)),
+    "report docx": lambda: reports.build_bookings_docx(iter(ROWS)),
+}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * p) - 1)]
+
+
+def measure(render, requests, per_request_assets):
+    timings = []
+    sizes = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        if per_request_assets:
+            assets._assets = assets.DocumentAssets(image_max_px=None).load()
+        sizes.append(len(render()))
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, statistics.mean(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    shared = assets.DocumentAssets().load()
+    print(f"font: {shared.font_name}")
+    for name, render in DOCUMENTS.items():
+        for label, per_request in (("per request", True), ("shared", False)):
+            assets._assets = shared
+            render()  # прогрев
+            timings, size = measure(render, args.requests, per_request)
+            print(f"{name:<12} {label:<12} median={statistics.median(timings):7.2f} ms  "
+                  f"p99={percentile(timings, 0.99):7.2f} ms  size={size / 1024:7.1f} KB")
+    assets._assets = shared
+
+
+if __name__ == "__main__":
+    main()
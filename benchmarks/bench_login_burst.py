@@ -0,0 +1,113 @@
+"""
+Задержка каталога, пока идут 100 одновременных входов: bcrypt в общем threadpool
+(как было - sync login_post) против отдельного пула auth.hash_pool.
+
+Общий threadpool имитируется пулом на 40 потоков (столько по умолчанию у Starlette/AnyIO),
+каталог - рендером страницы карточек (как в bench_cards.py) в этом же пуле каждые --interval с.
+
+Запуск из корня проекта (база не нужна):
+    python benchmarks/bench_login_burst.py --logins 100
+    QUEST_BCRYPT_ROUNDS=10 python benchmarks/bench_login_burst.py
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Environment, FileSystemLoader
+
+from bench_cards import TEMPLATES_DIR, make_quests
+from fragments import render_quest_cards
+import auth
+from bounded_pool import PoolBusy
+
+THREADPOOL_SIZE = 40
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * p) - 1)]
+
+
+async def catalog_probe(threadpool, render_page, stop, interval):
+    loop = asyncio.get_running_loop()
+    latencies = []
+    while not stop.is_set():
+        arrived = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        await loop.run_in_executor(threadpool, render_page)
+        latencies.append((time.perf_counter() - arrived) * 1000)
+    return latencies
+
+
+async def run_scenario(threadpool, render_page, logins, interval, login):
+    stop = asyncio.Event()
+    probe = asyncio.create_task(catalog_probe(threadpool, render_page, stop, interval))
+    await asyncio.sleep(interval * 5)  # несколько замеров до нагрузки
+
+    async def timed_login():
+        start = time.perf_counter()
+        try:
+            await login()
+        except PoolBusy:
+            return None
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    if login is not None:
+        login_ms = await asyncio.gather(*(timed_login() for _ in range(logins)))
+    else:
+        await asyncio.sleep(1)
+        login_ms = []
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    return await probe, login_ms, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.05, help="период запросов каталога, с")
+    args = parser.parse_args()
+
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=True)
+    quests = make_quests(15)
+    render_page = lambda: render_quest_cards(env, quests)
+    render_page()  # прогрев кэша карточек
+
+    hashed = auth.hash_password("bench-password")
+    threadpool = ThreadPoolExecutor(max_workers=THREADPOOL_SIZE)
+
+    async def threadpool_login():
+        # Как было: sync-обработчик, verify_password в общем threadpool
+        await asyncio.get_running_loop().run_in_executor(threadpool, auth.verify_password, "bench-password", hashed)
+
+    async def hash_pool_login():
+        await auth.verify_password_async("bench-password", hashed)
+
+    print(f"bcrypt rounds={auth.BCRYPT_ROUNDS}, hash workers={auth.HASH_WORKERS}, "
+          f"queue limit={auth.HASH_QUEUE_LIMIT}, cpu={os.cpu_count()}")
+    try:
+        for name, login in (("no logins", None), ("threadpool", threadpool_login), ("hash pool", hash_pool_login)):
+            latencies, login_ms, elapsed = asyncio.run(
+                run_scenario(threadpool, render_page, args.logins, args.interval, login))
+            served = [ms for ms in login_ms if ms is not None]
+            logins = (f"logins ok={len(served)} rejected={len(login_ms) - len(served)} "
+                      f"p50={statistics.median(served):.0f} ms" if served else "")
+            print(f"{name:<11} catalog median={statistics.median(latencies):8.2f} ms  "
+                  f"p99={percentile(latencies, 0.99):8.2f} ms  max={max(latencies):8.2f} ms  "
+                  f"({len(latencies)} requests, load {elapsed:.1f} s)  {logins}")
+        print("hash pool stats:", auth.hash_pool.stats())
+    finally:
+        threadpool.shutdown()
+        auth.hash_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Задержка "каталога" в цикле событий, пока формируются 50 чеков:
+прежний рендер прямо в async-обработчике против пула render_pool.
+
+Каталог имитируется рендером страницы карточек (как в bench_cards.py) каждые
+--interval мс; задержка считается от момента "прихода" запроса до ответа.
+
+Запуск из корня проекта (база не нужна):
+    python benchmarks/bench_render_concurrency.py --receipts 50 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Environment, FileSystemLoader
+
+from bench_cards import TEMPLATES_DIR, make_quests
+from fragments import render_quest_cards
+import documents
+from bounded_pool import BoundedPool
+from render_pool import RENDER_POOL_KIND, RENDER_QUEUE_LIMIT
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * p) - 1)]
+
+
+async def catalog_probe(render_page, stop, interval):
+    latencies = []
+    while not stop.is_set():
+        arrived = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        render_page()
+        latencies.append((time.perf_counter() - arrived) * 1000)
+    return latencies
+
+
+async def inline_receipt(i):
+    # Как было: ReportLab прямо в async def
+    return documents.render_receipt(f"Квест {i}", 2500, "bench")
+
+
+async def run_scenario(render_page, receipts, interval, make_receipt):
+    stop = asyncio.Event()
+    probe = asyncio.create_task(catalog_probe(render_page, stop, interval))
+    await asyncio.sleep(interval * 5)  # несколько замеров до нагрузки
+
+    start = time.perf_counter()
+    if make_receipt is not None:
+        await asyncio.gather(*(make_receipt(i) for i in range(receipts)))
+    else:
+        await asyncio.sleep(1)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    latencies = await probe
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--receipts", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=0.01, help="период запросов каталога, с")
+    args = parser.parse_args()
+
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=True)
+    quests = make_quests(15)
+    render_page = lambda: render_quest_cards(env, quests)
+    render_page()  # прогрев кэша карточек
+
+    documents.render_receipt("прогрев", 0, "bench")  # бланк чека собирается до fork, как в main.py
+    pool = BoundedPool(workers=args.workers, queue_limit=max(args.receipts, RENDER_QUEUE_LIMIT),
+                       kind=RENDER_POOL_KIND, name="render")
+    pool.start()
+
+    async def pooled_receipt(i):
+        return await pool.run(documents.render_receipt, f"Квест {i}", 2500, "bench")
+
+    try:
+        for name, make_receipt in (("no receipts", None), ("inline render", inline_receipt),
+                                   ("render pool", pooled_receipt)):
+            latencies, elapsed = asyncio.run(run_scenario(render_page, args.receipts, args.interval, make_receipt))
+            print(f"{name:<14} catalog median={statistics.median(latencies):7.2f} ms  "
+                  f"p99={percentile(latencies, 0.99):8.2f} ms  max={max(latencies):8.2f} ms  "
+                  f"({len(latencies)} requests, load {elapsed:.2f} s)")
+        print("pool stats:", pool.stats())
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
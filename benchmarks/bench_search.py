@@ -0,0 +1,110 @@
+"""
+Сравнение старого поиска (ILIKE '%q%' по title) и полнотекстового поиска
+по search_vector на засеянном каталоге.
+
+Запуск из корня проекта:
+    python benchmarks/bench_search.py --quests 20000 --runs 50
+
+По умолчанию используется база из database.py, адрес можно переопределить
+переменной окружения BENCH_DATABASE_URL. Засеянные квесты удаляются в конце.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import database
+import models
+import crud
+from migrations import run_migrations
+
+SEED_PREFIX = "bench-"
+WORDS = [
+    "тайна", "подвал", "заброшенный", "больница", "маньяк", "побег", "тюрьма", "шерлок",
+    "пираты", "сокровища", "лаборатория", "вирус", "зомби", "замок", "призрак", "детектив",
+    "ограбление", "банк", "космос", "станция", "магия", "школа", "лабиринт", "проклятие",
+]
+GENRES = ["детям", "страшные", "веселые", "с актерами", "без актеров", "нестрашные", "загадки"]
+QUERIES = ["подвал", "призрак замок", "зомби", "детектив ограбление", "космическая станция"]
+
+
+def seed(db, count):
+    rnd = random.Random(42)
+    rows = []
+    for i in range(count):
+        rows.append({
+            "title": f"{SEED_PREFIX}{i} " + " ".join(rnd.sample(WORDS, 3)),
+            "description": " ".join(rnd.choices(WORDS, k=40)),
+            "genre": ", ".join(rnd.sample(GENRES, 2)),
+            "difficulty": rnd.choice(["легкий", "нормальный", "сложный", "экстремальный"]),
+            "fear_level": rnd.randint(1, 5),
+            "players": rnd.randint(1, 6),
+            "price": rnd.randint(15, 60) * 100,
+        })
+    db.execute(models.Quest.__table__.insert(), rows)
+    db.commit()
+    db.execute(text("ANALYZE quests"))
+    db.commit()
+
+
+def cleanup(db):
+    db.query(models.Quest).filter(models.Quest.title.like(f"{SEED_PREFIX}%")).delete(synchronize_session=False)
+    db.commit()
+
+
+def legacy_search(db, q):
+    return db.query(models.Quest).filter(
+        models.Quest.title.ilike(f"%{q}%")
+    ).order_by(models.Quest.title.asc()).limit(15).all()
+
+
+def fulltext_search(db, q):
+    # Мимо catalog_cache: иначе повторяющиеся запросы мерили бы попадания в кэш, а не базу
+    quests, _ = crud._load_quests_page(db, skip=0, limit=15, filters={"q": q})
+    return quests
+
+
+def measure(fn, db, runs):
+    timings = []
+    for i in range(runs):
+        q = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        fn(db, q)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quests", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    url = os.environ.get("BENCH_DATABASE_URL", database.SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(url)
+    database.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    db = sessionmaker(bind=engine)()
+
+    try:
+        print(f"Засеваем {args.quests} квестов...")
+        seed(db, args.quests)
+        for name, fn in (("ILIKE title", legacy_search), ("full-text", fulltext_search)):
+            fn(db, QUERIES[0])  # прогрев
+            median, p95 = measure(fn, db, args.runs)
+            print(f"{name:<12} median={median:7.2f} ms  p95={p95:7.2f} ms")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import asyncio
+import math
+import multiprocessing
+import threading
+import time
+import weakref
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+METRICS_WINDOW = 1000
+
+
+class PoolBusy(Exception):
+    """Очередь пула заполнена"""
+
+
+def _timed_call(fn, args):
+    # Выполняется в воркере: возвращаем момент старта, чтобы отделить ожидание в очереди от работы
+    started = time.time()
+    return started, fn(*args)
+
+
+def _percentiles(samples) -> dict:
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+    result = {}
+    for name, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        result[name] = round(ordered[max(0, math.ceil(p * len(ordered)) - 1)], 2)
+    return result
+
+
+class BoundedPool:
+    """
+    Пул для тяжёлой работы вне цикла событий: процессы ("process") или потоки ("thread").
+    Число задач в работе и в очереди ограничено queue_limit: лишние сразу получают PoolBusy,
+    а не копятся в памяти. Задержки (ожидание, работа, всего) собираются по последним задачам.
+    Потоковые выгрузки (imap) занимают не больше stream_limit мест (по умолчанию половину очереди),
+    остальное всегда остаётся одиночным запросам (run).
+    Экземпляры: render_pool.pool (PDF/DOCX) и auth.hash_pool (bcrypt).
+    """
+
+    def __init__(self, workers: int, queue_limit: int, kind: str = "thread", name: str = "pool",
+                 stream_limit: int = None):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.stream_limit = max(1, queue_limit // 2) if stream_limit is None else stream_limit
+        self.stream_reserved = 0
+        self.kind = kind
+        self.name = name
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_ms = deque(maxlen=METRICS_WINDOW)
+        self._run_ms = deque(maxlen=METRICS_WINDOW)
+        self._total_ms = deque(maxlen=METRICS_WINDOW)
+
+    def _create_executor(self):
+        if self.kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        # fork: воркерам не нужно заново импортировать приложение (main.py создаёт таблицы и админа при импорте)
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def start(self):
+        """Создаёт пул и сразу поднимает воркеры, пока в процессе мало потоков"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+        for future in [self._executor.submit(time.time) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _restart(self, broken):
+        # Упавший процесс ломает весь ProcessPoolExecutor - пересоздаём его
+        with self._lock:
+            if self._executor is broken:
+                self._executor = self._create_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn, *args):
+        """Выполняет fn(*args) в пуле; fn и аргументы должны сериализоваться для процессов"""
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise PoolBusy()
+            self.in_flight += 1
+            self.submitted += 1
+
+        executor = self._get_executor()
+        future = self._submit(executor, fn, args)
+        try:
+            _, result = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+        return result
+
+    def imap(self, fn, args_iter, window: int = None):
+        """
+        Синхронный вариант для потоковых выгрузок: fn(*args) для каждого набора аргументов,
+        результаты по порядку. В пуле одновременно не больше window задач (по умолчанию - по числу
+        воркеров), поэтому память ограничена. Место под window резервируется сразу, при вызове:
+        если выгрузки уже заняли stream_limit - PoolBusy, и запрос можно отклонить до начала ответа.
+        """
+        window = min(window or self.workers, self.stream_limit)
+        with self._lock:
+            if self.stream_reserved + window > self.stream_limit:
+                self.rejected += 1
+                raise PoolBusy()
+            self.stream_reserved += window
+        results = self._imap(fn, args_iter, window)
+        # Резерв освобождается вместе с генератором - и после выгрузки, и если её так и не начали
+        weakref.finalize(results, self._release_stream, window)
+        return results
+
+    def _release_stream(self, window: int):
+        with self._lock:
+            self.stream_reserved -= window
+
+    def _imap(self, fn, args_iter, window: int):
+        executor = self._get_executor()
+        pending = deque()
+        try:
+            for args in args_iter:
+                with self._lock:
+                    self.in_flight += 1
+                    self.submitted += 1
+                pending.append(self._submit(executor, fn, args))
+                if len(pending) >= window:
+                    yield pending.popleft().result()[1]
+            while pending:
+                yield pending.popleft().result()[1]
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+        finally:
+            # Клиент оборвал скачивание - не рендерим то, что уже не нужно
+            for future in pending:
+                future.cancel()
+
+    def _submit(self, executor, fn, args):
+        # Вызывается после учёта задачи в in_flight
+        try:
+            future = executor.submit(_timed_call, fn, args)
+        except Exception:
+            self._record(None, None)
+            raise
+        # Место в очереди освобождается, когда воркер закончил, даже если клиент уже ушёл
+        future.add_done_callback(partial(self._record, time.time()))
+        return future
+
+    def _record(self, submitted_at, future):
+        finished_at = time.time()
+        with self._lock:
+            self.in_flight -= 1
+            if future is None or future.cancelled() or future.exception() is not None:
+                self.failed += 1
+                return
+            started_at = future.result()[0]
+            self.completed += 1
+            self._wait_ms.append((started_at - submitted_at) * 1000)
+            self._run_ms.append((finished_at - started_at) * 1000)
+            self._total_ms.append((finished_at - submitted_at) * 1000)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "kind": self.kind,
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "stream_limit": self.stream_limit,
+                "stream_reserved": self.stream_reserved,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.workers),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "wait_ms": _percentiles(self._wait_ms),
+                "run_ms": _percentiles(self._run_ms),
+                "total_ms": _percentiles(self._total_ms),
+            }
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis нужен только для общих версий (share_versions)
+    redis = None
+
+
+class VersionCounter:
+    """
+    Потокобезопасный счётчик версии данных (для инвалидации кэшей). По умолчанию живёт в памяти
+    процесса; после share() хранится в Redis и общий для всех воркеров - записи одного воркера
+    сбрасывают кэши и ETag остальных.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._value = 0
+        self._lock = threading.Lock()
+        self._client = None
+        self._key = None
+
+    @property
+    def shared(self) -> bool:
+        return self._client is not None
+
+    def share(self, client, prefix: str = "version:"):
+        self._client = client
+        self._key = prefix + self.name
+
+    @property
+    def value(self) -> int:
+        if self._client is not None:
+            return int(self._client.get(self._key) or 0)
+        return self._value
+
+    def bump(self) -> int:
+        if self._client is not None:
+            return self._client.incr(self._key)
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш с временем жизни записей и счётчиками попаданий"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Значение по ключу или None, если его нет или оно устарело"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# Версия каталога квестов: меняется при любой записи в quests / quest_genres
+catalog_version = VersionCounter("catalog")
+
+# Версия бронирований: меняется при создании и удалении броней
+bookings_version = VersionCounter("bookings")
+
+
+def share_versions(url: str):
+    """Версии данных в Redis: нужно, когда приложение запущено в нескольких воркерах"""
+    if redis is None:
+        raise RuntimeError("Для общих версий данных установите redis: pip install redis")
+    client = redis.Redis.from_url(url)
+    for counter in (catalog_version, bookings_version):
+        counter.share(client)
+
+
+# Результаты выборок каталога (get_quests_page)
+catalog_cache = TTLCache(maxsize=512, ttl=60.0)
+
+# Отрендеренные карточки квестов (_quest_card.html) по id квеста и выводимым полям
+quest_card_cache = TTLCache(maxsize=4096, ttl=3600.0)
+
+# Готовые отчёты (xlsx/pdf/docx) по ключу (формат, фильтры, версии данных)
+report_cache = TTLCache(maxsize=16, ttl=3600.0)
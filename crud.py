@@ -1,25 +1,172 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+import re
+import json
+from collections import Counter
+import base64
+import binascii
+
+from itertools import chain
+
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import and_, func, tuple_, event, values, column, true, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert, aggregate_order_by
 import models, schemas
-from datetime import datetime
+from datetime import datetime, timedelta
+from events import publish_slot
+import holds
+from cache import catalog_cache, catalog_version, bookings_version
+
+SEARCH_CONFIG = "russian"
+
+# Сортировки каталога: колонки ключа (всегда заканчиваются id) и направление
+QUEST_SORTS = {
+    "title_asc": (("title", "id"), False),
+    "title_desc": (("title", "id"), True),
+    "price_low": (("price", "id"), False),
+    "price_high": (("price", "id"), True),
+}
+DEFAULT_QUEST_SORT = "title_asc"
+
+
+# Какие модели влияют на какую версию данных (см. cache.py)
+TRACKED_MODELS = {
+    models.Quest: "catalog",
+    models.QuestGenre: "catalog",
+    models.Booking: "bookings",
+}
+DATA_VERSIONS = {
+    "catalog": catalog_version,
+    "bookings": bookings_version,
+}
+
+
+def _mark_changed(session, obj_class):
+    kind = TRACKED_MODELS.get(obj_class)
+    if kind:
+        session.info.setdefault("changed", set()).add(kind)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_changes(session, flush_context):
+    """Запоминает, какие данные менялись в транзакции"""
+    for obj in chain(session.new, session.dirty, session.deleted):
+        _mark_changed(session, type(obj))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_changes(orm_execute_state):
+    """insert()/update()/delete() через session.execute не проходят через flush, отмечаем их отдельно"""
+    state = orm_execute_state
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper:
+        _mark_changed(state.session, state.bind_mapper.class_)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_versions(session):
+    """
+    После коммита поднимаем версии изменённых данных и сбрасываем кэш каталога этого процесса.
+    В других воркерах записи кэша не найдутся по ключу с новой версией (см. cache.share_versions);
+    карточки квестов кэшируются по своим полям (fragments.py) и сброса не требуют.
+    """
+    for kind in session.info.pop("changed", ()):
+        DATA_VERSIONS[kind].bump()
+        if kind == "catalog":
+            catalog_cache.clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes(session):
+    session.info.pop("changed", None)
 
-def get_quests(db: Session, skip: int = 0, limit: int = 12, filters: dict = None):
+
+def catalog_cache_key(filters: dict, *extra):
+    """Ключ кэша: версия каталога + нормализованные фильтры + вид выборки (страница, количество)"""
+    normalized = []
+    for name, value in sorted((filters or {}).items()):
+        if not value:
+            continue
+        if name == "genre":
+            value = tuple(sorted(parse_genres(value)))
+        elif isinstance(value, (list, tuple)):
+            value = tuple(sorted(value))
+        normalized.append((name, value))
+    return (catalog_version.value, tuple(normalized)) + extra
+
+
+def encode_cursor(state: dict) -> str:
+    """Упаковывает состояние пагинации в непрозрачный токен"""
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    """Распаковывает токен курсора, при ошибке -> ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw.decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Некорректный курсор")
+    if not isinstance(state, dict):
+        raise ValueError("Некорректный курсор")
+    return state
+
+
+def build_search_tsquery(q: str):
+    """Превращает пользовательский ввод в префиксный tsquery: 'тёмн подв' -> 'тёмн:* & подв:*'"""
+    words = re.findall(r"\w+", q.lower())
+    if not words:
+        return None
+    return func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{word}:*" for word in words))
+
+
+def parse_genres(genres) -> list:
+    """Нормализует жанры из строки 'a, b' или списка в список без повторов"""
+    if isinstance(genres, str):
+        genres = genres.split(",")
+    result = []
+    for genre in genres:
+        for part in genre.split(","):
+            part = part.strip()
+            if part and part not in result:
+                result.append(part)
+    return result
+
+
+def set_quest_genres(quest: models.Quest, genres):
+    """Записывает жанры квеста и в строку для отображения, и в таблицу quest_genres"""
+    genres = parse_genres(genres)
+    quest.genre = ", ".join(genres)
+    current = {tag.genre: tag for tag in quest.genre_tags}
+    quest.genre_tags = [current.get(genre) or models.QuestGenre(genre=genre) for genre in genres]
+
+
+def get_quests(db: Session, skip: int = 0, limit: int = 12, filters: dict = None, cursor: str = None):
+    quests, _ = get_quests_page(db, skip=skip, limit=limit, filters=filters, cursor=cursor)
+    return quests
+
+
+def _filter_quests(db: Session, filters: dict):
+    """Строит запрос квестов по фильтрам, возвращает (query, rank) - rank есть только при поиске"""
     query = db.query(models.Quest)
+    rank = None
 
     if filters:
-        # Поиск по тексту
+        # Полнотекстовый поиск по названию, жанру и описанию (GIN индекс)
         if filters.get("q"):
-            q = f"%{filters['q']}%"
-            query = query.filter(models.Quest.title.ilike(q))
+            tsquery = build_search_tsquery(filters["q"])
+            if tsquery is not None:
+                query = query.filter(models.Quest.search_vector.op("@@")(tsquery))
+                rank = func.ts_rank_cd(models.Quest.search_vector, tsquery)
 
-        # Жанры
+        # Жанры: квест должен иметь все выбранные жанры (пересечение по индексу quest_genres)
         if filters.get("genre"):
-            if isinstance(filters["genre"], str):
-                genres = [g.strip() for g in filters["genre"].split(",")]
-            else:
-                genres = filters["genre"]
-            genre_filters = [models.Quest.genre.ilike(f"%{genre}%") for genre in genres]
-            query = query.filter(and_(*genre_filters))
+            genres = parse_genres(filters["genre"])
+            if genres:
+                matching = db.query(models.QuestGenre.quest_id).filter(
+                    models.QuestGenre.genre.in_(genres)
+                ).group_by(models.QuestGenre.quest_id).having(
+                    func.count(models.QuestGenre.genre) == len(genres)
+                )
+                query = query.filter(models.Quest.id.in_(matching))
 
         # Сложность
         if filters.get("difficulty"):
@@ -45,21 +192,91 @@ def get_quests(db: Session, skip: int = 0, limit: int = 12, filters: dict = None
             except ValueError:
                 pass
 
-    # Сортировка
-    if filters and filters.get("sort"):
-        sort = filters["sort"]
-        if sort == "title_asc":
-            query = query.order_by(models.Quest.title.asc())
-        elif sort == "title_desc":
-            query = query.order_by(models.Quest.title.desc())
-        elif sort == "price_low":
-            query = query.order_by(models.Quest.price.asc())
-        elif sort == "price_high":
-            query = query.order_by(models.Quest.price.desc())
-    else:
-        query = query.order_by(models.Quest.title.asc())
-
-    return query.offset(skip).limit(limit).all()
+    return query, rank
+
+
+def get_quests_page(db: Session, skip: int = 0, limit: int = 12, filters: dict = None, cursor: str = None):
+    """
+    Страница каталога через кэш catalog_cache.
+    Квесты из кэша отсоединены от сессии: доступны только колонки, без ленивых связей.
+    """
+    key = catalog_cache_key(filters, "page", skip, limit, cursor)
+    cached = catalog_cache.get(key)
+    if cached is not None:
+        return cached
+
+    quests, next_cursor = _load_quests_page(db, skip=skip, limit=limit, filters=filters, cursor=cursor)
+    for quest in quests:
+        db.expunge(quest)
+    result = (quests, next_cursor)
+    catalog_cache.set(key, result)
+    return result
+
+
+def count_quests(db: Session, filters: dict = None) -> int:
+    """Количество квестов по фильтрам (сортировка не учитывается), через кэш каталога"""
+    filters = {name: value for name, value in (filters or {}).items() if name != "sort"}
+    key = catalog_cache_key(filters, "count")
+    cached = catalog_cache.get(key)
+    if cached is not None:
+        return cached
+
+    query, _ = _filter_quests(db, filters)
+    total = query.order_by(None).count()
+    catalog_cache.set(key, total)
+    return total
+
+
+def _load_quests_page(db: Session, skip: int = 0, limit: int = 12, filters: dict = None, cursor: str = None):
+    """
+    Возвращает (квесты, курсор следующей страницы или None).
+    Для сортировок из QUEST_SORTS используется keyset-пагинация по (ключ, id),
+    поэтому стоимость страницы не зависит от глубины прокрутки.
+    Выдача поиска по релевантности листается смещением, спрятанным в том же курсоре.
+    Некорректный курсор -> ValueError.
+    """
+    query, rank = _filter_quests(db, filters)
+
+    sort = filters.get("sort") if filters else None
+    if sort not in QUEST_SORTS:
+        sort = "relevance" if rank is not None else DEFAULT_QUEST_SORT
+
+    state = decode_cursor(cursor) if cursor else None
+    if state is not None and state.get("s") != sort:
+        raise ValueError("Курсор относится к другой сортировке")
+
+    try:
+        if sort == "relevance":
+            offset = int(state["o"]) if state else skip
+            if offset < 0:
+                raise ValueError("Отрицательное смещение в курсоре")
+            rows = query.order_by(rank.desc(), models.Quest.id.desc()).offset(offset).limit(limit + 1).all()
+            next_state = {"s": sort, "o": offset + limit}
+        else:
+            names, descending = QUEST_SORTS[sort]
+            columns = [getattr(models.Quest, name) for name in names]
+            if state:
+                values = list(state["k"])
+                if len(values) != len(columns):
+                    raise ValueError("Курсор не соответствует ключу сортировки")
+                # Тип значения должен совпадать с колонкой, иначе ошибку вернёт уже Postgres (bool - тоже int)
+                for value, column in zip(values, columns):
+                    if isinstance(value, bool) or not isinstance(value, column.type.python_type):
+                        raise ValueError("Курсор не соответствует ключу сортировки")
+                key = tuple_(*columns)
+                query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+            elif skip:
+                query = query.offset(skip)
+            query = query.order_by(*[c.desc() if descending else c.asc() for c in columns])
+            rows = query.limit(limit + 1).all()
+            next_state = {"s": sort, "k": [getattr(rows[limit - 1], name) for name in names]} if len(rows) > limit else None
+    except (KeyError, TypeError):
+        raise ValueError("Некорректный курсор")
+
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(next_state)
+    return rows, None
+
 
 def get_quest(db: Session, quest_id: int):
     return db.query(models.Quest).filter(models.Quest.id == quest_id).first()
@@ -75,20 +292,66 @@ def get_quest_bookings(db: Session, quest_id: int):
     """Получает все бронирования для конкретного квеста"""
     return db.query(models.Booking).filter(
         models.Booking.quest_id == quest_id
-    ).join(models.User).order_by(models.Booking.date_time.desc()).all()
+    ).join(models.User).join(models.Quest).options(
+        contains_eager(models.Booking.user), contains_eager(models.Booking.quest)
+    ).order_by(*BOOKING_SORTS["date_desc"]()).all()
+
+def _apply_booking_stats(db: Session, slots, delta: int):
+    """
+    Инкрементально обновляет свёртки статистики в текущей транзакции.
+    slots - [(quest_id, starts_at), ...], delta - +1 при создании, -1 при удалении броней.
+    """
+    per_quest = Counter((quest_id, starts_at.date()) for quest_id, starts_at in slots if starts_at is not None)
+    per_slot = Counter((starts_at.date(), starts_at.strftime(SLOT_TIME_FORMAT)) for _, starts_at in slots if starts_at is not None)
+    if not per_quest:
+        return
+
+    stmt = pg_insert(models.QuestDayStats).values([
+        {"quest_id": quest_id, "day": day, "bookings": count * delta}
+        for (quest_id, day), count in per_quest.items()
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["quest_id", "day"],
+        set_={"bookings": models.QuestDayStats.bookings + stmt.excluded.bookings}
+    ))
+
+    stmt = pg_insert(models.SlotDayStats).values([
+        {"day": day, "timeslot": timeslot, "bookings": count * delta}
+        for (day, timeslot), count in per_slot.items()
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["day", "timeslot"],
+        set_={"bookings": models.SlotDayStats.bookings + stmt.excluded.bookings}
+    ))
+
+
+def _booked_starts(db: Session, quest_id: int):
+    """Времена начала всех броней квеста (для уведомлений об освобождении слотов)"""
+    return [starts_at for (starts_at,) in db.query(models.Booking.starts_at).filter(
+        models.Booking.quest_id == quest_id,
+        models.Booking.starts_at.isnot(None)
+    )]
 
 def delete_quest_bookings(db: Session, quest_id: int):
     """Удаляет все бронирования для квеста"""
+    released = _booked_starts(db, quest_id)
     db.query(models.Booking).filter(models.Booking.quest_id == quest_id).delete()
+    _apply_booking_stats(db, [(quest_id, starts_at) for starts_at in released], -1)
     db.commit()
+    for starts_at in released:
+        publish_slot(quest_id, starts_at, "released")
     return True
 
 def delete_quest(db: Session, quest_id: int):
     quest = db.query(models.Quest).filter(models.Quest.id == quest_id).first()
     if quest:
+        released = _booked_starts(db, quest_id)
         db.query(models.Booking).filter(models.Booking.quest_id == quest_id).delete()
+        _apply_booking_stats(db, [(quest_id, starts_at) for starts_at in released], -1)
         db.delete(quest)
         db.commit()
+        for starts_at in released:
+            publish_slot(quest_id, starts_at, "released")
         return True
     return False
 
@@ -97,67 +360,493 @@ def get_booked_slots(db: Session, quest_id: int):
     bookings = db.query(models.Booking).filter(models.Booking.quest_id == quest_id).all()
     return [booking.date_time for booking in bookings]
 
-def get_booked_slots_for_date(db: Session, quest_id: int, date: str):
-    """Получает занятые слоты для конкретной даты"""
-    bookings = db.query(models.Booking).filter(
+SLOT_DATE_FORMAT = "%Y-%m-%d"
+SLOT_TIME_FORMAT = "%H:%M"
+
+# Сеансы квестов (одинаковые для всех квестов)
+TIMESLOTS = ['08:00', '10:00', '12:00', '14:00', '16:00', '18:00', '20:00', '22:00']
+MAX_AVAILABILITY_DAYS = 62
+
+
+def parse_slot(date: str, timeslot: str) -> datetime:
+    """'YYYY-MM-DD' + 'HH:MM' -> datetime, при неверном формате ValueError"""
+    return datetime.strptime(f"{date} {timeslot}", f"{SLOT_DATE_FORMAT} {SLOT_TIME_FORMAT}")
+
+
+def get_held_slots(quest_id: int, date_from: str, date_to: str = None, user_id: int = None) -> set:
+    """
+    Начала слотов квеста за дни [date_from, date_to], временно удерживаемых другими пользователями.
+    Удержания живут вне базы (holds.store), поэтому учитываются и в ETag страниц с занятостью.
+    Неверные даты или слишком длинный период -> ValueError.
+    """
+    first_day, days_count = _availability_period(date_from, date_to or date_from)
+    days = [(first_day + timedelta(days=offset)).strftime(SLOT_DATE_FORMAT) for offset in range(days_count)]
+    candidates = [parse_slot(day, slot) for day in days for slot in TIMESLOTS]
+    return {starts_at for starts_at, holder in holds.store.holders(quest_id, candidates).items() if holder != user_id}
+
+
+def get_booked_slots_for_date(db: Session, quest_id: int, date: str, user_id: int = None, held: set = None):
+    """
+    Получает занятые слоты для конкретной даты (диапазон по индексу quest_id, starts_at).
+    Слоты, временно удерживаемые другими пользователями, тоже считаются занятыми
+    (held - уже полученные get_held_slots удержания).
+    """
+    try:
+        day_start = datetime.strptime(date, SLOT_DATE_FORMAT)
+    except ValueError:
+        return []
+
+    rows = db.query(models.Booking.starts_at).filter(
         models.Booking.quest_id == quest_id,
-        models.Booking.date_time.like(f"{date}%")
+        models.Booking.starts_at >= day_start,
+        models.Booking.starts_at < day_start + timedelta(days=1)
     ).all()
+    taken = {starts_at for (starts_at,) in rows}
+    taken |= held if held is not None else get_held_slots(quest_id, date, user_id=user_id)
 
-    booked_times = [booking.date_time.split(" ")[1] for booking in bookings]
-    return booked_times
+    return [starts_at.strftime(SLOT_TIME_FORMAT) for starts_at in sorted(taken)]
 
-def create_booking(db: Session, user_id: int, quest_id: int, date: str, timeslot: str):
-    """Создает бронирование, если слот свободен"""
-    date_time = f"{date} {timeslot}"
 
-    # Проверяем, не занят ли слот этим же пользователем
-    existing = db.query(models.Booking).filter(
+def hold_slot(db: Session, user_id: int, quest_id: int, date: str, timeslot: str) -> bool:
+    """
+    Удерживает слот за пользователем на holds.HOLD_TTL_SECONDS, пока он оформляет бронь.
+    У пользователя одно удержание на квест: новое снимает предыдущее.
+    False - слот уже забронирован или удерживается другим.
+    Неверный формат, сеанс не из TIMESLOTS, прошедший слот или нет квеста -> ValueError.
+    """
+    try:
+        starts_at = parse_slot(date, timeslot)
+    except ValueError:
+        raise ValueError("Некорректная дата или время")
+    if timeslot not in TIMESLOTS:
+        raise ValueError("Такого сеанса нет")
+    if starts_at <= datetime.now():
+        raise ValueError("Сеанс уже прошёл")
+    if not db.query(models.Quest.id).filter(models.Quest.id == quest_id).first():
+        raise ValueError("Квест не найден")
+
+    booked = db.query(models.Booking.id).filter(
         models.Booking.quest_id == quest_id,
-        models.Booking.date_time == date_time,
-        models.Booking.user_id == user_id
+        models.Booking.starts_at == starts_at
     ).first()
+    if booked:
+        return False
+    previous = holds.store.user_hold(quest_id, user_id)
+    if not holds.store.hold(quest_id, starts_at, user_id):
+        return False
+    if previous is not None and previous != starts_at and holds.store.release(quest_id, previous, user_id):
+        publish_slot(quest_id, previous, "released")
+    publish_slot(quest_id, starts_at, "held")
+    return True
 
-    if existing:
-        return None  # Пользователь уже забронировал этот слот
 
-    # Также проверяем, не занят ли слот вообще
-    existing_any = db.query(models.Booking).filter(
+def release_slot(user_id: int, quest_id: int, date: str, timeslot: str) -> bool:
+    """Снимает удержание слота пользователем"""
+    starts_at = parse_slot(date, timeslot)
+    if holds.store.release(quest_id, starts_at, user_id):
+        publish_slot(quest_id, starts_at, "released")
+        return True
+    return False
+
+
+def release_expired_holds():
+    """Удаляет просроченные удержания и сообщает об освободившихся слотах"""
+    for quest_id, starts_at in holds.store.purge_expired():
+        publish_slot(quest_id, starts_at, "released")
+
+
+def _availability_period(date_from: str, date_to: str):
+    """(первый день, число дней) периода; неверные даты или слишком длинный период -> ValueError"""
+    first_day = datetime.strptime(date_from, SLOT_DATE_FORMAT)
+    last_day = datetime.strptime(date_to, SLOT_DATE_FORMAT)
+    days_count = (last_day - first_day).days + 1
+    if days_count < 1 or days_count > MAX_AVAILABILITY_DAYS:
+        raise ValueError(f"Период должен быть от 1 до {MAX_AVAILABILITY_DAYS} дней")
+    return first_day, days_count
+
+
+def get_availability(db: Session, quest_id: int, date_from: str, date_to: str, user_id: int = None,
+                     held: set = None) -> dict:
+    """
+    Занятые и свободные слоты квеста по дням за период [date_from, date_to]
+    одним запросом по индексу (quest_id, starts_at). Слоты, удерживаемые другими
+    пользователями, считаются занятыми - как в get_booked_slots_for_date.
+    Неверные даты или слишком длинный период -> ValueError.
+    """
+    first_day, days_count = _availability_period(date_from, date_to)
+    if held is None:
+        held = get_held_slots(quest_id, date_from, date_to, user_id=user_id)
+
+    rows = db.query(models.Booking.starts_at).filter(
         models.Booking.quest_id == quest_id,
-        models.Booking.date_time == date_time
-    ).first()
+        models.Booking.starts_at >= first_day,
+        models.Booking.starts_at < first_day + timedelta(days=days_count)
+    ).all()
+
+    booked = {}
+    for starts_at in chain((starts_at for (starts_at,) in rows), held):
+        booked.setdefault(starts_at.strftime(SLOT_DATE_FORMAT), set()).add(starts_at.strftime(SLOT_TIME_FORMAT))
+
+    days = {}
+    for offset in range(days_count):
+        day = (first_day + timedelta(days=offset)).strftime(SLOT_DATE_FORMAT)
+        day_booked = booked.get(day, set())
+        days[day] = {
+            "booked": [slot for slot in TIMESLOTS if slot in day_booked],
+            "free": [slot for slot in TIMESLOTS if slot not in day_booked],
+        }
+    return days
+
+
+def search_available_quests(db: Session, date: str, time_from: str = None, time_to: str = None,
+                            filters: dict = None, group_size: int = None, limit: int = 30, user_id: int = None):
+    """
+    Квесты со свободными слотами на дату в окне [time_from, time_to].
+    Один запрос: отфильтрованные квесты x кандидатные слоты (VALUES) без броней,
+    свободные слоты собираются array_agg. Возвращает [(квест, ['HH:MM', ...]), ...].
+    Слоты, удерживаемые другими пользователями (не user_id), тоже не свободны: удержания живут
+    вне базы и вычитаются из найденного; квесты без свободных слотов добираются следующей пачкой.
+    group_size - квест должен вмещать не меньше стольких игроков.
+    Неверные дата/время -> ValueError.
+    """
+    datetime.strptime(date, SLOT_DATE_FORMAT)
+    time_from = time_from or TIMESLOTS[0]
+    time_to = time_to or TIMESLOTS[-1]
+    datetime.strptime(time_from, SLOT_TIME_FORMAT)
+    datetime.strptime(time_to, SLOT_TIME_FORMAT)
+
+    now = datetime.now()
+    candidates = [parse_slot(date, slot) for slot in TIMESLOTS if time_from <= slot <= time_to]
+    candidates = [starts_at for starts_at in candidates if starts_at > now]
+    if not candidates:
+        return []
 
-    if existing_any:
-        return None  # Слот уже занят другим пользователем
+    slots = values(column("starts_at", DateTime), name="slots").data([(starts_at,) for starts_at in candidates])
+    query, _ = _filter_quests(db, filters)
+    if group_size:
+        query = query.filter(models.Quest.players >= group_size)
 
-    booking = models.Booking(
+    booked = db.query(models.Booking.id).filter(
+        models.Booking.quest_id == models.Quest.id,
+        models.Booking.starts_at == slots.c.starts_at
+    ).exists()
+
+    query = query.join(slots, true()).filter(~booked).add_columns(
+        func.array_agg(aggregate_order_by(slots.c.starts_at, slots.c.starts_at))
+    ).group_by(models.Quest.id).order_by(models.Quest.title.asc(), models.Quest.id.asc())
+
+    found = []
+    offset = 0
+    while len(found) < limit:
+        rows = query.offset(offset).limit(limit).all()
+        for quest, free in rows:
+            held = {starts_at for starts_at, holder in holds.store.holders(quest.id, free).items()
+                    if holder != user_id}
+            free = [starts_at.strftime(SLOT_TIME_FORMAT) for starts_at in free if starts_at not in held]
+            if free:
+                found.append((quest, free))
+        if len(rows) < limit:
+            break
+        offset += limit
+    return found[:limit]
+
+
+def create_booking(db: Session, user_id: int, quest_id: int, date: str, timeslot: str):
+    """
+    Создает бронирование одним INSERT ... ON CONFLICT DO NOTHING по уникальному
+    индексу (quest_id, starts_at): занятый слот -> None, гонок между запросами нет.
+    Неверный формат даты/времени -> ValueError.
+    """
+    starts_at = parse_slot(date, timeslot)
+    if holds.store.held_by_other(quest_id, starts_at, user_id):
+        return None  # Слот удерживается другим пользователем
+
+    stmt = pg_insert(models.Booking).values(
         user_id=user_id,
         quest_id=quest_id,
-        date_time=date_time
-    )
+        date_time=starts_at.strftime(f"{SLOT_DATE_FORMAT} {SLOT_TIME_FORMAT}"),
+        starts_at=starts_at
+    ).on_conflict_do_nothing(
+        index_elements=["quest_id", "starts_at"]
+    ).returning(models.Booking)
 
-    db.add(booking)
+    booking = db.scalars(stmt).first()
+    if booking is None:
+        db.rollback()
+        return None  # Слот уже занят
+    _apply_booking_stats(db, [(quest_id, starts_at)], +1)
     db.commit()
-    db.refresh(booking)
+    holds.store.release(quest_id, starts_at, user_id)
+    publish_slot(quest_id, starts_at, "booked")
     return booking
 
+MAX_BATCH_SLOTS = 50
+
+
+def create_bookings_batch(db: Session, user_id: int, slots: list):
+    """
+    Бронирует пачку слотов [(quest_id, date, timeslot), ...] по принципу "всё или ничего".
+    Проверки делаются заранее, вставка - одним многострочным INSERT ... ON CONFLICT DO NOTHING
+    в одной транзакции; если хоть один слот занят, транзакция откатывается.
+    Возвращает (успех, результаты по слотам в порядке запроса). Статусы слотов:
+    booked, conflict (занят), held (удерживается другим), invalid (формат),
+    duplicate (повтор в запросе), unknown_quest (нет квеста),
+    skipped (не забронирован из-за других ошибок).
+    """
+    results = []
+    parsed = {}
+    for index, (quest_id, date, timeslot) in enumerate(slots):
+        result = {"quest_id": quest_id, "date": date, "timeslot": timeslot, "status": "skipped"}
+        results.append(result)
+        try:
+            key = (quest_id, parse_slot(date, timeslot))
+        except ValueError:
+            result["status"] = "invalid"
+            continue
+        if key in parsed:
+            result["status"] = "duplicate"
+            continue
+        parsed[key] = index
+
+    quest_ids = {quest_id for quest_id, _ in parsed}
+    known = {quest_id for (quest_id,) in db.query(models.Quest.id).filter(models.Quest.id.in_(quest_ids))}
+    for (quest_id, starts_at), index in parsed.items():
+        if quest_id not in known:
+            results[index]["status"] = "unknown_quest"
+        elif holds.store.held_by_other(quest_id, starts_at, user_id):
+            results[index]["status"] = "held"
+
+    if not parsed or any(result["status"] != "skipped" for result in results):
+        return False, results
+
+    stmt = pg_insert(models.Booking).values([
+        {
+            "user_id": user_id,
+            "quest_id": quest_id,
+            "date_time": starts_at.strftime(f"{SLOT_DATE_FORMAT} {SLOT_TIME_FORMAT}"),
+            "starts_at": starts_at,
+        }
+        for quest_id, starts_at in parsed
+    ]).on_conflict_do_nothing(
+        index_elements=["quest_id", "starts_at"]
+    ).returning(models.Booking.id, models.Booking.quest_id, models.Booking.starts_at)
+
+    # Берём только колонки: после commit ORM-объекты истекают, и чтение .id дало бы SELECT на каждую бронь
+    rows = db.execute(stmt).all()
+    inserted = {(row.quest_id, row.starts_at): row.id for row in rows}
+
+    if len(inserted) < len(parsed):
+        db.rollback()
+        for key, index in parsed.items():
+            if key not in inserted:
+                results[index]["status"] = "conflict"
+        return False, results
+
+    _apply_booking_stats(db, list(parsed), +1)
+    db.commit()
+    for key, index in parsed.items():
+        results[index]["status"] = "booked"
+        results[index]["booking_id"] = inserted[key]
+        holds.store.release(key[0], key[1], user_id)
+        publish_slot(key[0], key[1], "booked")
+    return True, results
+
+
 def get_user_bookings(db: Session, user_id: int):
     """Получает все бронирования пользователя"""
     return db.query(models.Booking).filter(
         models.Booking.user_id == user_id
-    ).join(models.Quest).order_by(models.Booking.date_time.desc()).all()
+    ).join(models.User).join(models.Quest).options(
+        contains_eager(models.Booking.user), contains_eager(models.Booking.quest)
+    ).order_by(*BOOKING_SORTS["date_desc"]()).all()
 
 def get_all_bookings(db: Session):
     """Получает все бронирования для администратора"""
-    return db.query(models.Booking).join(models.User).join(models.Quest).order_by(
-        models.Booking.date_time.desc()
-    ).all()
+    return db.query(models.Booking).join(models.User).join(models.Quest).options(
+        contains_eager(models.Booking.user), contains_eager(models.Booking.quest)
+    ).order_by(*BOOKING_SORTS["date_desc"]()).all()
+
+
+REPORT_CHUNK_SIZE = 1000
+
+
+def iter_report_rows(db: Session, filters: dict = None, chunk_size: int = REPORT_CHUNK_SIZE):
+    """
+    Строки отчёта (пользователь, email, квест, email организатора, цена) в порядке get_all_bookings.
+    Кортежи колонок с серверного курсора пачками по chunk_size - без ORM-объектов в памяти.
+    Фильтры - как у get_bookings_page; неверная дата -> ValueError.
+    """
+    query = db.query(
+        models.User.username, models.User.email, models.Quest.title,
+        models.Quest.organizer_email, models.Quest.price,
+    ).select_from(models.Booking).join(models.User).join(models.Quest)
+    return _filter_bookings(query, filters).order_by(*BOOKING_SORTS["date_desc"]()).yield_per(chunk_size)
+
+
+EXPORT_COLUMNS = ("booking_id", "starts_at", "date_time", "quest_id", "quest_title", "price",
+                  "user_id", "username", "email")
+
+
+def iter_export_rows(db: Session, filters: dict = None, chunk_size: int = REPORT_CHUNK_SIZE):
+    """Сырые строки броней для выгрузки (колонки EXPORT_COLUMNS) по id, с серверного курсора"""
+    query = db.query(
+        models.Booking.id, models.Booking.starts_at, models.Booking.date_time,
+        models.Quest.id, models.Quest.title, models.Quest.price,
+        models.User.id, models.User.username, models.User.email,
+    ).select_from(models.Booking).join(models.User).join(models.Quest)
+    return _filter_bookings(query, filters).order_by(models.Booking.id).yield_per(chunk_size)
+
+
+def iter_document_rows(db: Session, filters: dict = None, chunk_size: int = REPORT_CHUNK_SIZE):
+    """Брони для архива чеков и заявлений: (id брони, квест, цена, пользователь) по id, с серверного курсора"""
+    query = db.query(
+        models.Booking.id, models.Quest.title, models.Quest.price, models.User.username,
+    ).select_from(models.Booking).join(models.User).join(models.Quest)
+    return _filter_bookings(query, filters).order_by(models.Booking.id).yield_per(chunk_size)
+
+# Сортировки списка броней в админке. date_* идут по ix_bookings_starts_at_id; quest и user - по индексу
+# порядка квестов (ix_quests_title_id) или пользователей (уникальный username), брони каждого берутся
+# по ux_bookings_quest_starts_at / ix_bookings_user_starts_at и досортировываются внутри группы
+# (Incremental Sort) - без сортировки всей таблицы броней
+BOOKING_SORTS = {
+    "date_desc": lambda: (models.Booking.starts_at.desc().nulls_last(), models.Booking.id.desc()),
+    "date_asc": lambda: (models.Booking.starts_at.asc().nulls_last(), models.Booking.id.asc()),
+    "quest": lambda: (models.Quest.title.asc(), models.Quest.id.asc(),
+                      models.Booking.starts_at.desc().nulls_last(), models.Booking.id.desc()),
+    "user": lambda: (models.User.username.asc(),
+                     models.Booking.starts_at.desc().nulls_last(), models.Booking.id.desc()),
+}
+DEFAULT_BOOKING_SORT = "date_desc"
+
+
+def _filter_bookings(query, filters: dict = None):
+    """Фильтры броней date_from / date_to ('YYYY-MM-DD'), quest_id, user, user_id для запроса с join User и Quest"""
+    filters = filters or {}
+    if filters.get("date_from"):
+        query = query.filter(models.Booking.starts_at >= datetime.strptime(filters["date_from"], SLOT_DATE_FORMAT))
+    if filters.get("date_to"):
+        day_after = datetime.strptime(filters["date_to"], SLOT_DATE_FORMAT) + timedelta(days=1)
+        query = query.filter(models.Booking.starts_at < day_after)
+    if filters.get("quest_id"):
+        query = query.filter(models.Booking.quest_id == filters["quest_id"])
+    if filters.get("user"):
+        # lower(username) LIKE lower('начало') || '%' - по индексу ix_users_username_lower
+        prefix = re.sub(r"([\\%_])", r"\\\1", filters["user"])
+        query = query.filter(func.lower(models.User.username).like(func.lower(prefix) + "%", escape="\\"))
+    if filters.get("user_id"):
+        query = query.filter(models.Booking.user_id == filters["user_id"])
+    return query
+
+
+def get_bookings_page(db: Session, filters: dict = None, sort: str = None, page: int = 1, per_page: int = 50):
+    """
+    Страница броней для админки: фильтры date_from / date_to ('YYYY-MM-DD'),
+    quest_id, user (начало имени пользователя). Возвращает (брони, всего).
+    Неверная дата -> ValueError.
+    """
+    query = _filter_bookings(db.query(models.Booking).join(models.User).join(models.Quest), filters)
+    total = query.order_by(None).count()
+    order = BOOKING_SORTS.get(sort, BOOKING_SORTS[DEFAULT_BOOKING_SORT])()
+    bookings = query.options(
+        contains_eager(models.Booking.user), contains_eager(models.Booking.quest)
+    ).order_by(*order).offset((page - 1) * per_page).limit(per_page).all()
+    return bookings, total
+
+
+def get_quest_options(db: Session):
+    """Лёгкий список (id, title) всех квестов для выпадающих списков, через кэш каталога"""
+    key = catalog_cache_key({}, "options")
+    cached = catalog_cache.get(key)
+    if cached is not None:
+        return cached
+
+    options = db.query(models.Quest.id, models.Quest.title).order_by(models.Quest.title.asc()).all()
+    catalog_cache.set(key, options)
+    return options
+
+
+STATS_DEFAULT_DAYS = 30
+
+
+def get_booking_stats(db: Session, date_from: str = None, date_to: str = None) -> dict:
+    """
+    Статистика из свёрток quest_day_stats / slot_day_stats (без чтения таблицы броней).
+    Выручка считается по текущей цене квестов, как и в отчётах.
+    Период по умолчанию - последние и ближайшие STATS_DEFAULT_DAYS дней.
+    Неверная дата -> ValueError.
+    """
+    today = datetime.now().date()
+    first_day = datetime.strptime(date_from, SLOT_DATE_FORMAT).date() if date_from else today - timedelta(days=STATS_DEFAULT_DAYS)
+    last_day = datetime.strptime(date_to, SLOT_DATE_FORMAT).date() if date_to else today + timedelta(days=STATS_DEFAULT_DAYS)
+    if last_day < first_day:
+        raise ValueError("Конец периода раньше начала")
+    days_count = (last_day - first_day).days + 1
+
+    quest_stats = models.QuestDayStats
+    per_quest_rows = db.query(
+        models.Quest.id, models.Quest.title, models.Quest.price,
+        func.coalesce(func.sum(quest_stats.bookings), 0)
+    ).outerjoin(quest_stats, and_(
+        quest_stats.quest_id == models.Quest.id,
+        quest_stats.day >= first_day,
+        quest_stats.day <= last_day
+    )).group_by(models.Quest.id).order_by(models.Quest.title.asc()).all()
+
+    quests_count = len(per_quest_rows)
+    capacity_per_day = quests_count * len(TIMESLOTS)
+
+    per_quest = []
+    total_bookings = total_revenue = 0
+    for quest_id, title, price, bookings in per_quest_rows:
+        bookings = int(bookings)
+        revenue = bookings * (price or 0)
+        total_bookings += bookings
+        total_revenue += revenue
+        per_quest.append({"quest_id": quest_id, "title": title, "bookings": bookings, "revenue": revenue,
+                          "occupancy": round(bookings / (len(TIMESLOTS) * days_count), 4)})
+
+    per_day_rows = dict(db.query(models.SlotDayStats.day, func.sum(models.SlotDayStats.bookings)).filter(
+        models.SlotDayStats.day >= first_day,
+        models.SlotDayStats.day <= last_day
+    ).group_by(models.SlotDayStats.day).all())
+    per_day = []
+    for offset in range(days_count):
+        day = first_day + timedelta(days=offset)
+        bookings = int(per_day_rows.get(day) or 0)
+        per_day.append({"day": day.strftime(SLOT_DATE_FORMAT), "bookings": bookings,
+                        "occupancy": round(bookings / capacity_per_day, 4) if capacity_per_day else 0.0})
+
+    per_slot_rows = dict(db.query(models.SlotDayStats.timeslot, func.sum(models.SlotDayStats.bookings)).filter(
+        models.SlotDayStats.day >= first_day,
+        models.SlotDayStats.day <= last_day
+    ).group_by(models.SlotDayStats.timeslot).all())
+    per_slot = []
+    for timeslot in TIMESLOTS:
+        bookings = int(per_slot_rows.get(timeslot) or 0)
+        capacity = quests_count * days_count
+        per_slot.append({"timeslot": timeslot, "bookings": bookings,
+                         "occupancy": round(bookings / capacity, 4) if capacity else 0.0})
+
+    return {
+        "date_from": first_day.strftime(SLOT_DATE_FORMAT),
+        "date_to": last_day.strftime(SLOT_DATE_FORMAT),
+        "total_bookings": total_bookings,
+        "total_revenue": total_revenue,
+        "per_quest": per_quest,
+        "per_day": per_day,
+        "per_slot": per_slot,
+    }
+
 
 def delete_booking(db: Session, booking_id: int):
     """Удаляет бронирование"""
     booking = db.query(models.Booking).filter(models.Booking.id == booking_id).first()
     if booking:
+        quest_id, starts_at = booking.quest_id, booking.starts_at
         db.delete(booking)
+        _apply_booking_stats(db, [(quest_id, starts_at)], -1)
         db.commit()
+        if starts_at is not None:
+            publish_slot(quest_id, starts_at, "released")
         return True
     return False
\ No newline at end of file
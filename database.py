@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine
+import contextvars
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -19,3 +22,34 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=False)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+# --- Счётчик SQL-запросов (на запрос приложения или на блок кода в тестах) ---
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+
+_query_counter = contextvars.ContextVar("query_counter", default=None)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+
+@contextmanager
+def count_queries():
+    """
+    with count_queries() as counter:
+        ...
+    assert counter.count <= 3
+    """
+    counter = QueryCounter()
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
@@ -0,0 +1,255 @@
+import io
+import os
+import re
+import threading
+from datetime import datetime
+
+from docx import Document
+from docx.shared import Pt
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+from assets import get_assets
+from docx_template import DocxTemplate
+from letterhead import PdfLetterhead
+
+STATEMENT_TEMPLATE_PATH = "templates/statement_template.docx"
+
+PDF_MEDIA_TYPE = "application/pdf"
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+RECEIPT_PAGE = dict(pagesize=A4, rightMargin=40, leftMargin=40, topMargin=40, bottomMargin=40)
+
+# Рендер выполняется в пуле (см. render_pool.py): функции модуля получают и возвращают только
+# простые значения, чтобы их можно было передавать в процессы
+
+
+def create_statement_template():
+    """Создает шаблон заявления если его нет"""
+    template_path = STATEMENT_TEMPLATE_PATH
+
+    doc = Document()
+
+    # Заголовок
+    title = doc.add_paragraph()
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    title_run = title.add_run("Заявление об отказе от претензий")
+    title_run.bold = True
+    title_run.font.size = Pt(14)
+
+    doc.add_paragraph()  # Пустая строка
+
+    # Текст с метками
+    content = doc.add_paragraph()
+    content.add_run("Я, {full_name},")
+    content.add_run("\n(Ф.И.О.)\n\n")
+    content.add_run("серия {passport_series} номер {passport_number} паспорта,\n\n")
+
+    content.add_run(
+        'будучи зарегистрированным пользователем системы бронирования квестов "Алиби" и сознавая степень риска и особенности, связанные с участием в квестах с актерами, добровольно заявляю о своем решении принять участие в данном виде развлечений.\n\n')
+
+    content.add_run('Я полностью осознаю и добровольно принимаю на себя все риски, связанные с:\n')
+    content.add_run('• психологическим воздействием и элементами страха в ходе прохождения квеста;\n')
+    content.add_run('• физической активностью и перемещениями в условиях ограниченного пространства;\n')
+    content.add_run('• взаимодействием с актерами и импровизационными элементами программы;\n')
+    content.add_run('• нахождением в помещениях со специальными эффектами (световые, звуковые, дымовые и др.).\n\n')
+
+    content.add_run('Я подтверждаю, что:\n')
+    content.add_run('• не имею медицинских противопоказаний к участию в активных играх;\n')
+    content.add_run('• не страдаю сердечно-сосудистыми заболеваниями;\n')
+    content.add_run('• не имею психических расстройств;\n')
+    content.add_run('• не нахожусь в состоянии алкогольного или наркотического опьянения;\n')
+    content.add_run('• предупрежден о возможности фото- и видеосъемки в ходе квеста.\n\n')
+
+    content.add_run('С условиями участия ознакомлен и согласен.\n\n')
+
+    # Подпись
+    sign = doc.add_paragraph()
+    sign.add_run("Ф.И.О. участника: _________________________")
+    sign.add_run("\n\n(подпись)\n\n")
+    sign.add_run("Дата: {current_date}.")
+
+    doc.save(template_path)
+    return template_path
+
+
+_statement = None
+_statement_lock = threading.Lock()
+
+
+def statement_template() -> DocxTemplate:
+    """Шаблон заявления в памяти (см. docx_template.py); файл читается один раз на процесс"""
+    global _statement
+    if _statement is None:
+        with _statement_lock:
+            if _statement is None:
+                if not os.path.exists(STATEMENT_TEMPLATE_PATH):
+                    create_statement_template()
+                _statement = DocxTemplate(STATEMENT_TEMPLATE_PATH).load()
+    return _statement
+
+
+def render_statement(fields: dict) -> bytes:
+    """Заявление об отказе от претензий по шаблону Word; fields - full_name, passport_series, passport_number, quest_title"""
+    return statement_template().render({
+        'full_name': fields['full_name'],
+        'passport_series': fields['passport_series'],
+        'passport_number': fields['passport_number'],
+        'current_date': datetime.now().strftime('%d.%m.%Y'),
+        'quest_title': fields.get('quest_title', '')
+    })
+
+
+def _receipt_story(assets, lines: dict):
+    """Чек целиком; lines - flowable для переменных строк (заказ, дата, клиент, сумма)"""
+    styles = _receipt_styles(assets)
+    story = []
+
+    # Логотип
+    logo = assets.pdf_image("logo", 80, 80, hAlign='LEFT')
+    if logo is not None:
+        story.append(logo)
+        story.append(Spacer(1, 10))
+
+    # Шапка чека
+    story.append(Paragraph("Алиби", styles['ReceiptTitle']))
+    story.append(Paragraph("Квест-проект", styles['ReceiptText']))
+    story.append(Spacer(1, 15))
+
+    # Реквизиты
+    story.append(Paragraph("Юридический адрес: 125009, г. Москва, ул. Квестовая, д. 88", styles['ReceiptText']))
+    story.append(Paragraph("ИНН: 7701234567", styles['ReceiptText']))
+    story.append(Paragraph("КПП: 770101001", styles['ReceiptText']))
+    story.append(Paragraph("ОГРН: 1234567890123", styles['ReceiptText']))
+    story.append(Paragraph("Р/с: 40702810123450123456", styles['ReceiptText']))
+    story.append(Paragraph('Банк: ПАО "СБЕРБАНК" г. Москва', styles['ReceiptText']))
+    story.append(Paragraph("БИК: 044525225", styles['ReceiptText']))
+    story.append(Paragraph("К/с: 30101810400000000225", styles['ReceiptText']))
+
+    story.append(Spacer(1, 15))
+
+    # Линия разделитель (имитация)
+    story.append(Paragraph("_" * 80, styles['ReceiptText']))
+    story.append(Spacer(1, 15))
+
+    # Информация о заказе
+    story.append(Paragraph("КАССОВЫЙ ЧЕК", styles['ReceiptBold']))
+    story.append(Spacer(1, 10))
+
+    story.append(lines['order'])
+    story.append(lines['date'])
+    story.append(lines['client'])
+    story.append(Spacer(1, 10))
+
+    # Сумма
+    story.append(lines['sum'])
+    story.append(Spacer(1, 10))
+
+    # НДС
+    story.append(Paragraph("В том числе НДС 20%: -", styles['ReceiptText']))
+    story.append(Paragraph("Согласно Упрощенной системе налогообложения", styles['ReceiptText']))
+
+    story.append(Spacer(1, 20))
+
+    # Печать
+    stamp = assets.pdf_image("stamp", 80, 80, hAlign='RIGHT')
+    if stamp is not None:
+        story.append(stamp)
+
+    # Подпись
+    story.append(Spacer(1, 10))
+    story.append(Paragraph("Подпись: _________________", styles['ReceiptText']))
+    return story
+
+
+def _receipt_styles(assets):
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='ReceiptTitle', fontName=assets.bold_font_name, fontSize=16, leading=18, alignment=1))
+    styles.add(ParagraphStyle(name='ReceiptText', fontName=assets.font_name, fontSize=10, leading=12))
+    styles.add(ParagraphStyle(name='ReceiptBold', fontName=assets.bold_font_name, fontSize=10, leading=12))
+    return styles
+
+
+# Стиль каждой переменной строки чека
+RECEIPT_LINE_STYLES = {'order': 'ReceiptText', 'date': 'ReceiptText', 'client': 'ReceiptText', 'sum': 'ReceiptBold'}
+
+
+def _receipt_lines(quest_title, quest_price, client_name) -> dict:
+    return {
+        'order': f"Заказ: {quest_title}",
+        'date': f"Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}",
+        'client': f"Клиент: {client_name}",
+        'sum': f"Сумма: {quest_price} руб.",
+    }
+
+
+_letterhead = None
+_letterhead_lock = threading.Lock()
+
+
+def receipt_letterhead():
+    """
+    Скомпилированный бланк чека (см. letterhead.py) или None, если бланк собрать нельзя
+    (например, нет TrueType-шрифта). Собирается один раз на процесс; при старте - заранее.
+    """
+    global _letterhead
+    if _letterhead is None:
+        with _letterhead_lock:
+            if _letterhead is None:
+                try:
+                    assets = get_assets()
+                    styles = _receipt_styles(assets)
+                    letterhead = PdfLetterhead()
+                    slots = {name: letterhead.slot(name, styles[style]) for name, style in RECEIPT_LINE_STYLES.items()}
+                    _letterhead = letterhead.compile(_receipt_story(assets, slots), **RECEIPT_PAGE)
+                except Exception as e:
+                    print(f"⚠️ Бланк чека не собран, чеки будут рендериться целиком: {e}")
+                    _letterhead = False
+    return _letterhead or None
+
+
+def _render_receipt_full(lines: dict) -> bytes:
+    """Полный рендер platypus - для строк, которые не помещаются в бланк"""
+    buffer = io.BytesIO()
+    assets = get_assets()
+    styles = _receipt_styles(assets)
+    flowables = {name: Paragraph(text, styles[RECEIPT_LINE_STYLES[name]]) for name, text in lines.items()}
+    SimpleDocTemplate(buffer, **RECEIPT_PAGE).build(_receipt_story(assets, flowables))
+    return buffer.getvalue()
+
+
+def render_receipt(quest_title: str, quest_price, client_name: str) -> bytes:
+    """Кассовый чек в PDF с поддержкой кириллицы: готовый бланк + строки заказа"""
+    lines = _receipt_lines(quest_title, quest_price, client_name)
+    letterhead = receipt_letterhead()
+    if letterhead is not None:
+        pdf = letterhead.render(lines)
+        if pdf is not None:
+            return pdf
+    return _render_receipt_full(lines)
+
+
+# Документы по брони для архива (см. /bookings/documents.zip)
+BOOKING_DOCUMENTS = ("receipt", "statement")
+# Паспортных данных в базе нет - в заявлении остаются поля для заполнения от руки
+STATEMENT_BLANK = "__________"
+
+
+def _safe_filename(text: str) -> str:
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", text).strip("_") or "quest"
+
+
+def render_booking_document(kind: str, booking_id: int, quest_title: str, quest_price, username: str):
+    """Чек или заявление по брони: (имя файла в архиве, байты); выполняется в пуле рендера"""
+    title = _safe_filename(quest_title)
+    if kind == "receipt":
+        return f"{booking_id}_chek_{title}.pdf", render_receipt(quest_title, quest_price, username)
+    content = render_statement({
+        'full_name': username,
+        'passport_series': STATEMENT_BLANK,
+        'passport_number': STATEMENT_BLANK,
+        'quest_title': quest_title,
+    })
+    return f"{booking_id}_zayavlenie_{title}.docx", content
@@ -0,0 +1,106 @@
+import io
+import re
+import zipfile
+
+# Части документа, в которых ищутся метки {name}
+TEMPLATE_PARTS = re.compile(r"word/(document|header\d*|footer\d*)\.xml")
+
+_PARAGRAPH = re.compile(rb"<w:p[ >].*?</w:p>", re.S)
+_TEXT = re.compile(rb"(<w:t(?:\s[^>]*)?>)(.*?)</w:t>", re.S)
+_PLACEHOLDER = re.compile(rb"\{(\w+)\}")
+
+_PRESERVE = b' xml:space="preserve"'
+# Перевод строки и табуляция в значении - как у python-docx (run.text)
+_VALUE_ESCAPES = str.maketrans({
+    "&": "&amp;", "<": "&lt;", ">": "&gt;",
+    "\n": '</w:t><w:br/><w:t xml:space="preserve">',
+    "\t": '</w:t><w:tab/><w:t xml:space="preserve">',
+})
+
+
+def _compile_part(xml: bytes) -> list:
+    """
+    Разбивает XML части на статичные куски и слоты. Метка может быть разрезана Word'ом на несколько
+    <w:t> внутри абзаца: слот ставится в первый из них, остатки метки из следующих удаляются.
+    """
+    edits = {}  # позиция -> (конец, замена); замена - bytes или имя метки
+    for paragraph in _PARAGRAPH.finditer(xml):
+        nodes = []  # (начало в тексте абзаца, начало текста в xml, длина, открывающий тег)
+        joined = []
+        length = 0
+        for node in _TEXT.finditer(xml, paragraph.start(), paragraph.end()):
+            nodes.append((length, node.start(2), node.end(2) - node.start(2), node.span(1)))
+            joined.append(node.group(2))
+            length += node.end(2) - node.start(2)
+        for match in _PLACEHOLDER.finditer(b"".join(joined)):
+            name = match.group(1).decode()
+            first = True
+            for text_start, xml_start, size, (tag_start, tag_end) in nodes:
+                start, end = max(match.start(), text_start), min(match.end(), text_start + size)
+                if start >= end:
+                    continue
+                span_start, span_end = xml_start + start - text_start, xml_start + end - text_start
+                edits[span_start] = (span_end, name if first else b"")
+                first = False
+                tag = xml[tag_start:tag_end]
+                if b"xml:space" not in tag:
+                    edits[tag_start] = (tag_end, tag[:-1] + _PRESERVE + b">")
+
+    segments = []
+    position = 0
+    for start in sorted(edits):
+        end, replacement = edits[start]
+        segments.append(xml[position:start])
+        segments.append(replacement)
+        position = end
+    segments.append(xml[position:])
+    # Склеиваем соседние статичные куски
+    compiled = []
+    for segment in segments:
+        if isinstance(segment, bytes) and compiled and isinstance(compiled[-1], bytes):
+            compiled[-1] += segment
+        else:
+            compiled.append(segment)
+    return compiled
+
+
+class DocxTemplate:
+    """
+    Шаблон Word в памяти. load() читает .docx один раз и размечает метки {name} в XML;
+    render() подставляет значения в готовые куски байтов и дописывает изменённые части
+    к заранее собранному архиву с остальными файлами - без разбора документа python-docx.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.placeholders = set()
+        self._parts = {}
+        self._base_zip = None
+
+    def load(self):
+        base = io.BytesIO()
+        with zipfile.ZipFile(self.path) as source, zipfile.ZipFile(base, "w", zipfile.ZIP_DEFLATED) as target:
+            for info in source.infolist():
+                data = source.read(info)
+                if TEMPLATE_PARTS.fullmatch(info.filename):
+                    segments = _compile_part(data)
+                    slots = {segment for segment in segments if isinstance(segment, str)}
+                    if slots:
+                        self.placeholders |= slots
+                        self._parts[info.filename] = segments
+                        continue
+                target.writestr(info.filename, data)
+        self._base_zip = base.getvalue()
+        return self
+
+    def render(self, values: dict) -> bytes:
+        """Документ со значениями; метки без значения остаются как есть"""
+        buffer = io.BytesIO(self._base_zip)
+        with zipfile.ZipFile(buffer, "a", zipfile.ZIP_DEFLATED) as target:
+            for filename, segments in self._parts.items():
+                target.writestr(filename, b"".join(
+                    segment if isinstance(segment, bytes)
+                    else str(values.get(segment, "{%s}" % segment)).translate(_VALUE_ESCAPES).encode()
+                    for segment in segments
+                ))
+        return buffer.getvalue()
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+
+try:
+    import redis
+    import redis.asyncio as redis_async
+except ImportError:  # redis нужен только для RedisBroker
+    redis = None
+    redis_async = None
+
+
+def slot_channel(quest_id: int, date: str) -> str:
+    """Канал событий по слотам квеста на конкретную дату"""
+    return f"slots:{quest_id}:{date}"
+
+
+class Subscription(ABC):
+    """Подписка на канал: get(timeout) -> сообщение или None по таймауту"""
+
+    @abstractmethod
+    async def get(self, timeout: float):
+        """Следующее сообщение или None, если за timeout ничего не пришло"""
+
+    @abstractmethod
+    async def close(self):
+        """Отписывается от канала"""
+
+
+class Broker(ABC):
+    """Интерфейс pub/sub. publish вызывается из синхронного кода (CRUD в пуле потоков)"""
+
+    @abstractmethod
+    def publish(self, channel: str, message: dict):
+        """Отправляет сообщение всем подписчикам канала"""
+
+    @abstractmethod
+    async def subscribe(self, channel: str) -> Subscription:
+        """Новая подписка на канал"""
+
+
+class _QueueSubscription(Subscription):
+    def __init__(self, broker, channel, loop, queue):
+        self._broker = broker
+        self._channel = channel
+        self.loop = loop
+        self.queue = queue
+
+    async def get(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self._broker._unsubscribe(self._channel, self)
+
+
+class InMemoryBroker(Broker):
+    """Хаб внутри процесса: подходит для одного воркера"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(self._deliver, subscription.queue, message)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                self._unsubscribe(channel, subscription)
+
+    @staticmethod
+    def _deliver(queue, message):
+        # Медленный клиент не должен копить память: лишние события отбрасываем
+        if not queue.full():
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> Subscription:
+        subscription = _QueueSubscription(self, channel, asyncio.get_running_loop(),
+                                          asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, channel, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+
+class _RedisSubscription(Subscription):
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    async def get(self, timeout: float):
+        message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message["data"])
+
+    async def close(self):
+        await self._pubsub.unsubscribe()
+        await self._pubsub.aclose()
+
+
+class RedisBroker(Broker):
+    """Хаб через Redis pub/sub: события доходят до клиентов всех воркеров"""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("Для RedisBroker установите redis: pip install redis")
+        self._publisher = redis.Redis.from_url(url)
+        self._client = redis_async.Redis.from_url(url)
+
+    def publish(self, channel: str, message: dict):
+        self._publisher.publish(channel, json.dumps(message, ensure_ascii=False))
+
+    async def subscribe(self, channel: str) -> Subscription:
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(channel)
+        return _RedisSubscription(pubsub)
+
+
+broker: Broker = InMemoryBroker()
+
+
+def set_broker(new_broker: Broker):
+    global broker
+    broker = new_broker
+
+
+def publish_slot(quest_id: int, starts_at, status: str):
+    """Сообщает открытым страницам квеста, что слот занят (booked) или освободился (released)"""
+    date = starts_at.strftime("%Y-%m-%d")
+    try:
+        broker.publish(slot_channel(quest_id, date), {
+            "quest_id": quest_id,
+            "date": date,
+            "timeslot": starts_at.strftime("%H:%M"),
+            "status": status,
+        })
+    except Exception as e:
+        # Бронь уже сохранена, недоставленное событие не должно её ломать
+        print(f"⚠️ Не удалось отправить событие слота: {e}")
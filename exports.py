@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+import zipfile
+import zlib
+from itertools import islice
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен, без него работает стандартный json
+    orjson = None
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+# Строк на один отправляемый кусок: меньше - больше накладных расходов, больше - больше памяти
+ROWS_PER_CHUNK = 1000
+
+
+class ChunkSink:
+    """Файлоподобный приёмник для ZipFile без seek: копит сжатые байты до отправки клиенту"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def csv_chunks(columns, rows):
+    """CSV с заголовком, кусками по ROWS_PER_CHUNK строк"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batches(rows, ROWS_PER_CHUNK):
+        writer.writerows([_plain(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _dump_line(record: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def ndjson_chunks(columns, rows):
+    """По объекту JSON на строку"""
+    for batch in _batches(rows, ROWS_PER_CHUNK):
+        yield b"".join(_dump_line(dict(zip(columns, map(_plain, row)))) for row in batch)
+
+
+def gzip_chunks(chunks, level: int = 6):
+    """Сжатие потока кусков в gzip без накопления всего ответа"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(export_format: str, columns, rows, gzip: bool = False):
+    chunks = (csv_chunks if export_format == "csv" else ndjson_chunks)(columns, rows)
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def zip_chunks(files):
+    """
+    ZIP-архив из (имя, байты) по мере их поступления: в памяти только текущий файл.
+    PDF и DOCX уже сжаты, поэтому файлы кладутся без повторного сжатия (ZIP_STORED).
+    """
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+            yield sink.take()
+    yield sink.take()
@@ -0,0 +1,29 @@
+from markupsafe import Markup
+
+from cache import quest_card_cache
+
+CARD_TEMPLATE = "_quest_card.html"
+
+
+# Поля квеста, которые выводит карточка: они входят в ключ кэша, поэтому карточка, изменённая
+# в другом воркере, здесь не устареет - просто не найдётся по ключу
+CARD_FIELDS = ("title", "genre", "difficulty", "price", "description", "image_path")
+
+
+def card_cache_key(quest) -> tuple:
+    return (quest.id,) + tuple(getattr(quest, name) for name in CARD_FIELDS)
+
+
+def render_quest_card(env, quest) -> str:
+    """HTML карточки квеста из кэша, при промахе рендерит и кладёт в кэш"""
+    key = card_cache_key(quest)
+    html = quest_card_cache.get(key)
+    if html is None:
+        html = env.get_template(CARD_TEMPLATE).render(quest=quest)
+        quest_card_cache.set(key, html)
+    return html
+
+
+def render_quest_cards(env, quests) -> Markup:
+    """Сетка карточек собирается склейкой закэшированных фрагментов"""
+    return Markup("".join(render_quest_card(env, quest) for quest in quests))
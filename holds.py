@@ -0,0 +1,208 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+try:
+    import redis
+except ImportError:  # redis нужен только для RedisHoldStore
+    redis = None
+
+HOLD_TTL_SECONDS = 300
+
+
+SLOT_KEY_FORMAT = "%Y-%m-%dT%H:%M"
+
+
+def _slot_key(quest_id: int, starts_at) -> str:
+    return f"{quest_id}:{starts_at.strftime(SLOT_KEY_FORMAT)}"
+
+
+def _parse_slot_key(slot: str):
+    quest_id, starts_at = slot.split(":", 1)
+    return int(quest_id), datetime.strptime(starts_at, SLOT_KEY_FORMAT)
+
+
+class HoldStore(ABC):
+    """
+    Временные удержания слотов на время оформления брони.
+    Ключ - (квест, начало слота), значение - id пользователя, держащего слот.
+    """
+
+    @abstractmethod
+    def hold(self, quest_id: int, starts_at, user_id: int, ttl: int = HOLD_TTL_SECONDS) -> bool:
+        """Удерживает слот; True если слот свободен или уже удерживается этим же пользователем"""
+
+    @abstractmethod
+    def release(self, quest_id: int, starts_at, user_id: int) -> bool:
+        """Снимает удержание, если оно принадлежит пользователю"""
+
+    @abstractmethod
+    def user_hold(self, quest_id: int, user_id: int):
+        """Начало слота квеста, который сейчас удерживает пользователь, или None"""
+
+    @abstractmethod
+    def holders(self, quest_id: int, slots) -> dict:
+        """{начало слота: id пользователя} для удерживаемых слотов из списка"""
+
+    @abstractmethod
+    def purge_expired(self) -> list:
+        """
+        Удаляет просроченные удержания, возвращает [(quest_id, starts_at), ...].
+        Каждое истёкшее удержание возвращается один раз - даже при нескольких воркерах.
+        """
+
+    def held_by_other(self, quest_id: int, starts_at, user_id: int) -> bool:
+        holder = self.holders(quest_id, [starts_at]).get(starts_at)
+        return holder is not None and holder != user_id
+
+
+class InMemoryHoldStore(HoldStore):
+    """Удержания в памяти процесса (один воркер)"""
+
+    def __init__(self):
+        self._holds = {}
+        self._by_user = {}  # (user_id, quest_id) -> начало слота
+        self._lock = threading.Lock()
+
+    def hold(self, quest_id, starts_at, user_id, ttl=HOLD_TTL_SECONDS):
+        key = (quest_id, starts_at)
+        now = time.monotonic()
+        with self._lock:
+            current = self._holds.get(key)
+            if current and current[1] > now and current[0] != user_id:
+                return False
+            self._holds[key] = (user_id, now + ttl)
+            self._by_user[(user_id, quest_id)] = starts_at
+            return True
+
+    def release(self, quest_id, starts_at, user_id):
+        key = (quest_id, starts_at)
+        with self._lock:
+            current = self._holds.get(key)
+            if current and current[0] == user_id:
+                del self._holds[key]
+                if self._by_user.get((user_id, quest_id)) == starts_at:
+                    del self._by_user[(user_id, quest_id)]
+                return True
+            return False
+
+    def user_hold(self, quest_id, user_id):
+        now = time.monotonic()
+        with self._lock:
+            starts_at = self._by_user.get((user_id, quest_id))
+            current = self._holds.get((quest_id, starts_at))
+            if current and current[0] == user_id and current[1] > now:
+                return starts_at
+            return None
+
+    def holders(self, quest_id, slots):
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for starts_at in slots:
+                current = self._holds.get((quest_id, starts_at))
+                if current and current[1] > now:
+                    result[starts_at] = current[0]
+        return result
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._holds.items() if expires_at <= now]
+            for key in expired:
+                user_id, _ = self._holds.pop(key)
+                quest_id, starts_at = key
+                if self._by_user.get((user_id, quest_id)) == starts_at:
+                    del self._by_user[(user_id, quest_id)]
+        return expired
+
+
+class RedisHoldStore(HoldStore):
+    """
+    Удержания в Redis (общие для всех воркеров), истечение - через TTL ключей.
+    Сроки удержаний дублируются в отсортированном множестве: по нему purge_expired находит истёкшие
+    ключи (сам Redis об истечении не сообщает без keyspace-уведомлений) и забирает их атомарно,
+    поэтому "released" по каждому истёкшему удержанию отправляет ровно один воркер.
+    """
+
+    # Снимаем удержание, только если оно наше; заодно - ссылку пользователя на слот и срок
+    _RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        if redis.call('get', KEYS[2]) == ARGV[2] then
+            redis.call('del', KEYS[2])
+        end
+        redis.call('zrem', KEYS[3], ARGV[2])
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+    # Забираем истёкшие к ARGV[1] удержания, ключ которых Redis уже удалил
+    # (если часы воркера спешат, ключ ещё жив - заберём при следующем проходе)
+    _PURGE_SCRIPT = """
+    local expired = {}
+    for _, slot in ipairs(redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1])) do
+        if redis.call('exists', ARGV[2] .. slot) == 0 then
+            redis.call('zrem', KEYS[1], slot)
+            table.insert(expired, slot)
+        end
+    end
+    return expired
+    """
+
+    def __init__(self, url: str, prefix: str = "hold:"):
+        if redis is None:
+            raise RuntimeError("Для RedisHoldStore установите redis: pip install redis")
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._expiry_key = f"{prefix}expiry"
+        self._release = self._client.register_script(self._RELEASE_SCRIPT)
+        self._purge = self._client.register_script(self._PURGE_SCRIPT)
+
+    def _user_key(self, quest_id, user_id):
+        return f"{self._prefix}user:{user_id}:{quest_id}"
+
+    def hold(self, quest_id, starts_at, user_id, ttl=HOLD_TTL_SECONDS):
+        key = self._prefix + _slot_key(quest_id, starts_at)
+        if not self._client.set(key, user_id, nx=True, ex=ttl):
+            holder = self._client.get(key)
+            if holder is None or int(holder) != user_id:
+                return False
+            self._client.expire(key, ttl)
+        slot = _slot_key(quest_id, starts_at)
+        pipe = self._client.pipeline()
+        pipe.set(self._user_key(quest_id, user_id), slot, ex=ttl)
+        pipe.zadd(self._expiry_key, {slot: time.time() + ttl})
+        pipe.execute()
+        return True
+
+    def release(self, quest_id, starts_at, user_id):
+        key = self._prefix + _slot_key(quest_id, starts_at)
+        return bool(self._release(keys=[key, self._user_key(quest_id, user_id), self._expiry_key],
+                                  args=[user_id, _slot_key(quest_id, starts_at)]))
+
+    def user_hold(self, quest_id, user_id):
+        value = self._client.get(self._user_key(quest_id, user_id))
+        if value is None:
+            return None
+        _, starts_at = _parse_slot_key(value.decode())
+        return starts_at if self.holders(quest_id, [starts_at]).get(starts_at) == user_id else None
+
+    def purge_expired(self):
+        expired = self._purge(keys=[self._expiry_key], args=[time.time(), self._prefix])
+        return [_parse_slot_key(slot.decode()) for slot in expired]
+
+    def holders(self, quest_id, slots):
+        slots = list(slots)
+        if not slots:
+            return {}
+        values = self._client.mget([self._prefix + _slot_key(quest_id, starts_at) for starts_at in slots])
+        return {starts_at: int(value) for starts_at, value in zip(slots, values) if value is not None}
+
+
+store: HoldStore = InMemoryHoldStore()
+
+
+def set_store(new_store: HoldStore):
+    global store
+    store = new_store
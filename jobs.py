@@ -0,0 +1,118 @@
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+from cache import TTLCache, bookings_version, catalog_version, report_cache
+from database import SessionLocal
+import crud
+import reports
+
+REPORT_WORKERS = 2
+REPORT_JOB_TTL = 3600.0
+# Задачи держат ссылку на готовый файл, поэтому их число ограничено
+REPORT_JOBS_MAX = 64
+
+
+def report_key(report_format: str, filters: dict):
+    """Ключ готового отчёта: формат, фильтры и версии данных, из которых он построен"""
+    normalized = tuple(sorted((name, value) for name, value in filters.items() if value))
+    return (report_format, normalized, bookings_version.value, catalog_version.value)
+
+
+def render_report(report_format: str, filters: dict) -> bytes:
+    """Строит отчёт в своей сессии (вызывается в потоке пула)"""
+    build = reports.REPORT_FORMATS[report_format][0]
+    db = SessionLocal()
+    try:
+        return build(crud.iter_report_rows(db, filters))
+    finally:
+        db.close()
+
+
+class ReportJob:
+    """Задача на формирование отчёта: queued -> running -> done / failed"""
+
+    def __init__(self, report_format: str, filters: dict, key):
+        self.id = uuid.uuid4().hex
+        self.format = report_format
+        self.filters = filters
+        self.key = key
+        self.status = "queued"
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+        # Результат - содержимое файла; его же можно ждать из async-обработчика через asyncio.wrap_future
+        self.future = Future()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "format": self.format,
+            "filters": self.filters,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "finished_at": self.finished_at.isoformat(timespec="seconds") if self.finished_at else None,
+            "download_url": f"/admin/reports/{self.id}/download" if self.status == "done" else None,
+        }
+
+
+class ReportQueue:
+    """Очередь отчётов на пуле потоков: обработчики не блокируют цикл событий"""
+
+    def __init__(self, workers: int = REPORT_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        self._jobs = TTLCache(maxsize=REPORT_JOBS_MAX, ttl=REPORT_JOB_TTL)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, report_format: str, filters: dict) -> ReportJob:
+        """
+        Ставит отчёт в очередь. Готовый отчёт с теми же данными отдаётся из кэша сразу,
+        а повторный запрос того же отчёта присоединяется к задаче, которая уже выполняется.
+        """
+        key = report_key(report_format, filters)
+        with self._lock:
+            job = self._pending.get(key)
+            if job is not None:
+                return job
+
+            job = ReportJob(report_format, filters, key)
+            self._jobs.set(job.id, job)
+            content = report_cache.get(key)
+            if content is not None:
+                self._finish(job, content)
+            else:
+                self._pending[key] = job
+                self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def _run(self, job: ReportJob):
+        job.status = "running"
+        try:
+            content = render_report(job.format, job.filters)
+        except Exception as e:
+            print(f"⚠️ Не удалось сформировать отчёт {job.format}: {e}")
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = datetime.now()
+            job.future.set_exception(e)
+        else:
+            report_cache.set(job.key, content)
+            self._finish(job, content)
+        finally:
+            with self._lock:
+                self._pending.pop(job.key, None)
+
+    @staticmethod
+    def _finish(job: ReportJob, content: bytes):
+        job.status = "done"
+        job.finished_at = datetime.now()
+        job.future.set_result(content)
+
+
+report_queue = ReportQueue()
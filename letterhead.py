@@ -0,0 +1,149 @@
+import io
+import re
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfdoc import xObjectName
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Flowable, SimpleDocTemplate
+
+# Символы, которые можно подставлять в бланк без полного рендера. Глифы попадают в шрифт шаблона
+# при компиляции; строки с другими символами (и с разметкой <>&) рендерятся целиком, как раньше
+LETTERHEAD_CHARSET = (
+    "".join(chr(c) for c in range(32, 127) if chr(c) not in "<>&")
+    + "".join(chr(c) for c in range(0x410, 0x450))
+    + "Ёё№«»–—…"
+)
+
+
+class _Slot(Flowable):
+    """
+    Место под переменную строку бланка. На странице - вызов пустой формы (XObject) с именем слота:
+    render() подменяет её содержимое строкой, и текст стоит в потоке страницы на своём месте.
+    Набор символов заносится в подмножество шрифта документа без вывода на страницу.
+    """
+
+    def __init__(self, form, charset, style):
+        super().__init__()
+        self.form = form
+        self.charset = charset
+        self.style = style
+        self.codes = None
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        self.height = self.style.leading
+        return self.width, self.height
+
+    def draw(self):
+        font = pdfmetrics.getFont(self.style.fontName)
+        if not isinstance(font, TTFont):
+            raise ValueError(f"Для бланка нужен TrueType-шрифт, а не {self.style.fontName}")
+        doc = self.canv._doc
+        # splitString назначает символам коды в подмножествах этого документа - как при выводе текста,
+        # но без операторов на странице; подмножества встраиваются при сохранении PDF
+        chars = iter(self.charset)
+        self.codes = {}
+        for subset, codes in font.splitString(self.charset, doc):
+            name = font.getSubsetInternalName(subset, doc)
+            for code in codes:
+                self.codes[next(chars)] = (name, code)
+        self.canv.doForm(self.form)
+        self.canv.beginForm(self.form)
+        self.canv.endForm()
+
+    def encode(self, text: str):
+        """Содержимое формы для строки или None, если строку нельзя вывести без полного рендера"""
+        style = self.style
+        if pdfmetrics.stringWidth(text, style.fontName, style.fontSize) > self.width:
+            return None  # Paragraph перенёс бы строку
+        chunks = []
+        for char in text.replace("\xa0", " "):
+            if char in "<>&" or char not in self.codes:
+                return None
+            name, code = self.codes[char]
+            if chunks and chunks[-1][0] == name:
+                chunks[-1][1].append(code)
+            else:
+                chunks.append((name, bytearray([code])))
+        # Форма рисуется в координатах слота; базовая линия первой строки - как у Paragraph
+        ops = [f"0 g BT 1 0 0 1 0 {self.height - style.fontSize:.2f} Tm"]
+        for name, codes in chunks:
+            ops.append(f"{name} {style.fontSize} Tf <{codes.hex()}> Tj")
+        ops.append("ET\n")
+        return " ".join(ops).encode("latin-1")
+
+
+class PdfLetterhead:
+    """
+    Одностраничный PDF-бланк: статическая часть (картинки, реквизиты, шрифты) собирается platypus
+    один раз при compile(), а render() меняет в готовых байтах только формы слотов - дописывает их
+    объекты с новыми строками, xref и trailer.
+    """
+
+    def __init__(self, charset: str = LETTERHEAD_CHARSET):
+        self.charset = charset
+        self._slots = {}
+        self._body = None
+
+    def slot(self, name: str, style) -> Flowable:
+        """Flowable для истории compile(): на этом месте render() выведет строку values[name]"""
+        slot = self._slots[name] = _Slot(f"LetterheadSlot_{name}", self.charset, style)
+        return slot
+
+    def compile(self, story, **doc_kwargs):
+        buffer = io.BytesIO()
+        SimpleDocTemplate(buffer, **doc_kwargs).build(story)
+        missing = [name for name, slot in self._slots.items() if slot.codes is None]
+        if missing:
+            raise ValueError(f"Слоты не попали в бланк: {', '.join(missing)}")
+        self._assemble(buffer.getvalue())
+        return self
+
+    def _assemble(self, pdf: bytes):
+        xref_at = int(re.search(rb"startxref\s+(\d+)", pdf).group(1))
+        entries = re.findall(rb"(\d{10}) \d{5} n", pdf[xref_at:pdf.index(b"trailer", xref_at)])
+        offsets = [int(offset) for offset in entries]  # объекты 1..N по порядку номеров
+        self._size = len(offsets) + 1
+
+        ends = sorted(offsets) + [xref_at]
+        objects = {num: pdf[start:ends[ends.index(start) + 1]] for num, start in enumerate(offsets, 1)}
+        pages = [num for num, obj in objects.items() if re.search(rb"/Type /Page\b", obj)]
+        if len(pages) != 1:
+            raise ValueError("Бланк должен занимать одну страницу")
+
+        # Формы слотов пишутся заново при каждом render(): в заготовке остаётся словарь без /Length
+        self._forms = {}
+        for name, slot in self._slots.items():
+            xobject = re.escape(xObjectName(slot.form).encode())
+            num = int(re.search(rb"/" + xobject + rb" (\d+) 0 R", pdf).group(1))
+            header = objects.pop(num).split(b"stream", 1)[0]
+            header = re.sub(rb"/Filter (\[[^\]]*\]|/\w+) ?|/Length \d+ ?", b"", header)
+            self._forms[name] = (num, header.replace(b"<<", b"<< /Length %d ", 1))
+
+        body = [pdf[:min(offsets)]]
+        position = len(body[0])
+        self._offsets = {}
+        for num in sorted(objects, key=lambda n: offsets[n - 1]):
+            self._offsets[num] = position
+            body.append(objects[num])
+            position += len(objects[num])
+        self._body = b"".join(body)
+        self._trailer = pdf[pdf.index(b"trailer", xref_at):pdf.index(b"startxref", xref_at)]
+
+    def render(self, values: dict):
+        """PDF с подставленными строками или None, если какую-то строку нельзя вывести в бланке"""
+        parts = [self._body]
+        position = len(self._body)
+        offsets = dict(self._offsets)
+        for name, (num, header) in self._forms.items():
+            content = self._slots[name].encode(values.get(name, ""))
+            if content is None:
+                return None
+            form = header % len(content) + b"stream\n" + content + b"endstream\nendobj\n"
+            offsets[num] = position
+            parts.append(form)
+            position += len(form)
+        parts.append(b"xref\n0 %d\n0000000000 65535 f \n" % self._size)
+        parts.extend(b"%010d 00000 n \n" % offsets[num] for num in range(1, self._size))
+        parts.append(self._trailer + b"startxref\n%d\n%%%%EOF\n" % position)
+        return b"".join(parts)
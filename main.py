@@ -1,52 +1,50 @@
 import os
-import io
+import asyncio
 import shutil
 import uuid
+import zlib
 from typing import Optional, List
 from datetime import datetime
 
 import urllib.parse
 
 from fastapi import (
-    FastAPI, Request, Form, UploadFile, File, Depends, HTTPException
+    FastAPI, Request, Form, UploadFile, File, Depends, HTTPException, Query
 )
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.shared import Inches
-from docx.oxml.shared import qn
-from docx.oxml import parse_xml
-from docx.oxml.ns import nsdecls
-
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl.drawing.image import Image as XLImage
-
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-
 import json
 from datetime import datetime
 
-from database import engine, Base, SessionLocal
+try:
+    import orjson
+except ImportError:  # orjson не обязателен, без него работает стандартный json
+    orjson = None
+
+from database import engine, Base, SessionLocal, count_queries
+from migrations import run_migrations
+from cache import catalog_cache, catalog_version, bookings_version, quest_card_cache, report_cache, share_versions
+from fragments import render_quest_cards
+import events
+import holds
 import models
 import crud
-from auth import hash_password, verify_password, get_db, get_current_user, require_admin
-from schemas import QuestCreate
+import reports
+import jobs
+import exports
+import documents
+import assets
+import render_pool
+from bounded_pool import PoolBusy
+from auth import (hash_password, hash_password_async, verify_password_async, get_db, get_current_user,
+                  require_admin, hash_pool)
+from schemas import QuestCreate, QuestOut, BookingBatchCreate
 import uvicorn
 
 # --- Подготовка директорий ---
@@ -57,12 +55,31 @@ os.makedirs("templates", exist_ok=True)
 app = FastAPI()
 app.add_middleware(SessionMiddleware, secret_key="!secret_dev_change_me!")
 
+# --- Количество SQL-запросов на HTTP-запрос (заголовок X-Query-Count) ---
+@app.middleware("http")
+async def query_count_middleware(request: Request, call_next):
+    with count_queries() as counter:
+        response = await call_next(request)
+    response.headers["X-Query-Count"] = str(counter.count)
+    return response
+
+
+# --- События слотов, удержания и версии данных: по умолчанию в процессе, для нескольких воркеров - Redis ---
+if os.environ.get("QUEST_REDIS_URL"):
+    events.set_broker(events.RedisBroker(os.environ["QUEST_REDIS_URL"]))
+    holds.set_store(holds.RedisHoldStore(os.environ["QUEST_REDIS_URL"]))
+    share_versions(os.environ["QUEST_REDIS_URL"])
+elif int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+    print("⚠️ Несколько воркеров без QUEST_REDIS_URL: кэши, ETag, удержания и события слотов у каждого свои")
+
 # --- Статика и шаблоны ---
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["render_quest_cards"] = lambda quests: render_quest_cards(templates.env, quests)
 
 # --- Создание таблиц ---
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 
 # --- Создание дефолтного админа ---
@@ -87,24 +104,42 @@ def create_default_admin():
 create_default_admin()
 
 
-# --- Регистрация шрифтов для PDF ---
-def register_fonts():
-    try:
-        # Попробуем использовать стандартные шрифты
-        pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
-        pdfmetrics.registerFont(TTFont('Arial-Bold', 'arialbd.ttf'))
-        return True
-    except:
+# --- Шрифты, картинки, бланк чека и шаблон заявления: один раз при импорте, до запуска пула рендера ---
+# (воркеры пула получают всё уже загруженным через fork)
+assets.get_assets()
+documents.receipt_letterhead()
+documents.statement_template()
+
+
+# --- Фоновое снятие просроченных удержаний слотов ---
+HOLD_PURGE_INTERVAL_SECONDS = 10
+
+
+async def purge_holds_forever():
+    while True:
+        await asyncio.sleep(HOLD_PURGE_INTERVAL_SECONDS)
         try:
-            # Альтернативные шрифты
-            pdfmetrics.registerFont(TTFont('Helvetica', 'helvetica.ttf'))
-            pdfmetrics.registerFont(TTFont('Helvetica-Bold', 'helveticab.ttf'))
-            return True
-        except:
-            return False
+            await run_in_threadpool(crud.release_expired_holds)
+        except Exception as e:
+            print(f"⚠️ Ошибка при снятии удержаний: {e}")
 
 
-register_fonts()
+@app.on_event("startup")
+async def start_hold_purger():
+    app.state.hold_purger = asyncio.create_task(purge_holds_forever())
+
+
+# --- Пул рендера документов: процессы создаются при старте, до запросов ---
+@app.on_event("startup")
+def start_render_pool():
+    # Соединения из пула движка не должны достаться дочерним процессам
+    engine.dispose()
+    render_pool.pool.start()
+
+
+@app.on_event("shutdown")
+def stop_render_pool():
+    render_pool.pool.shutdown()
 
 
 # --- Хелперы ---
@@ -118,60 +153,76 @@ def save_upload(file: UploadFile) -> str:
     return f"uploads/{safe_name}"
 
 
-def create_statement_template():
-    """Создает шаблон заявления если его нет"""
-    template_path = "templates/statement_template.docx"
+# Версии данных в памяти процесса (без Redis) - ETag одного воркера не должен совпасть с ETag другого;
+# общие версии в Redis дают одинаковый ETag во всех воркерах
+ETAG_INSTANCE = "shared" if catalog_version.shared else uuid.uuid4().hex[:8]
+
+
+def make_etag(request: Request, kind: str, *parts) -> str:
+    """Слабый ETag из версий данных и id пользователя из сессии"""
+    user_id = request.session.get("user_id") or 0
+    tag = "-".join(str(p) for p in (ETAG_INSTANCE, kind, *parts, f"u{user_id}"))
+    return f'W/"{tag}"'
 
-    doc = Document()
 
-    # Заголовок
-    title = doc.add_paragraph()
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    title_run = title.add_run("Заявление об отказе от претензий")
-    title_run.bold = True
-    title_run.font.size = Pt(14)
+def holds_tag(held) -> str:
+    """Часть ETag для удержаний слотов: они меняются без записи в базу и без bookings_version"""
+    if not held:
+        return "h0"
+    return f"h{zlib.crc32(','.join(sorted(s.isoformat() for s in held)).encode()):x}"
 
-    doc.add_paragraph()  # Пустая строка
 
-    # Текст с метками
-    content = doc.add_paragraph()
-    content.add_run("Я, {full_name},")
-    content.add_run("\n(Ф.И.О.)\n\n")
-    content.add_run("серия {passport_series} номер {passport_number} паспорта,\n\n")
+def etag_matches(request: Request, etag: str) -> bool:
+    """Сравнение If-None-Match по правилам слабого сравнения"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
 
-    content.add_run(
-        'будучи зарегистрированным пользователем системы бронирования квестов "Алиби" и сознавая степень риска и особенности, связанные с участием в квестах с актерами, добровольно заявляю о своем решении принять участие в данном виде развлечений.\n\n')
 
-    content.add_run('Я полностью осознаю и добровольно принимаю на себя все риски, связанные с:\n')
-    content.add_run('• психологическим воздействием и элементами страха в ходе прохождения квеста;\n')
-    content.add_run('• физической активностью и перемещениями в условиях ограниченного пространства;\n')
-    content.add_run('• взаимодействием с актерами и импровизационными элементами программы;\n')
-    content.add_run('• нахождением в помещениях со специальными эффектами (световые, звуковые, дымовые и др.).\n\n')
+def dump_json(data) -> bytes:
+    """Быстрая сериализация через orjson, если он установлен"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
-    content.add_run('Я подтверждаю, что:\n')
-    content.add_run('• не имею медицинских противопоказаний к участию в активных играх;\n')
-    content.add_run('• не страдаю сердечно-сосудистыми заболеваниями;\n')
-    content.add_run('• не имею психических расстройств;\n')
-    content.add_run('• не нахожусь в состоянии алкогольного или наркотического опьянения;\n')
-    content.add_run('• предупрежден о возможности фото- и видеосъемки в ходе квеста.\n\n')
 
-    content.add_run('С условиями участия ознакомлен и согласен.\n\n')
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
 
-    # Подпись
-    sign = doc.add_paragraph()
-    sign.add_run("Ф.И.О. участника: _________________________")
-    sign.add_run("\n\n(подпись)\n\n")
-    sign.add_run("Дата: {current_date}.")
 
-    doc.save(template_path)
-    return template_path
+def with_etag(response: Response, etag: str) -> Response:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 
 # --- Маршруты ---
+CATALOG_PAGE_SIZE = 15
+CATALOG_MAX_PAGE_SIZE = 60
+
+
+def get_catalog_page(db: Session, filters: dict, skip: int, limit: int, cursor: Optional[str]):
+    """Страница каталога по курсору; битый курсор -> 400"""
+    try:
+        return crud.get_quests_page(db, skip=skip, limit=limit, filters=filters, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request, q: Optional[str] = None, genre: Optional[str] = None,
-          difficulty: Optional[str] = None, sort: Optional[str] = None,
-          skip: int = 0, db: Session = Depends(get_db)):
+def index(request: Request, q: Optional[str] = None, genre: Optional[List[str]] = Query(None),
+          difficulty: Optional[List[str]] = Query(None), sort: Optional[str] = None,
+          skip: int = 0, cursor: Optional[str] = None, db: Session = Depends(get_db)):
     filters = {}
     if q:
         filters["q"] = q
@@ -182,23 +233,31 @@ def index(request: Request, q: Optional[str] = None, genre: Optional[str] = None
     if sort:
         filters["sort"] = sort
 
-    quests = crud.get_quests(db, skip=skip, limit=15, filters=filters)
+    etag = make_etag(request, "index", f"c{catalog_version.value}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    quests, next_cursor = get_catalog_page(db, filters, skip, CATALOG_PAGE_SIZE, cursor)
     try:
         user = get_current_user(request, db)
     except:
         user = None
-    return templates.TemplateResponse("index.html", {
+    return with_etag(templates.TemplateResponse("index.html", {
         "request": request,
         "quests": quests,
         "user": user,
         "skip": skip,
+        "next_cursor": next_cursor,
         "now": datetime.now
-    })
+    }), etag)
 
 
 @app.get("/api/quests", response_class=HTMLResponse)
-def api_quests(request: Request, q: Optional[str] = None, genre: Optional[str] = None,
-               difficulty: Optional[str] = None, skip: int = 0, limit: int = 6, db: Session = Depends(get_db)):
+def api_quests(request: Request, q: Optional[str] = None, genre: Optional[List[str]] = Query(None),
+               difficulty: Optional[List[str]] = Query(None), sort: Optional[str] = None,
+               skip: int = 0, limit: int = CATALOG_PAGE_SIZE, cursor: Optional[str] = None,
+               db: Session = Depends(get_db)):
+    """HTML-фрагмент следующей страницы, курсор продолжения - в заголовке X-Next-Cursor"""
     filters = {}
     if q:
         filters["q"] = q
@@ -206,50 +265,260 @@ def api_quests(request: Request, q: Optional[str] = None, genre: Optional[str] =
         filters["genre"] = genre
     if difficulty:
         filters["difficulty"] = difficulty
-    quests = crud.get_quests(db, skip=skip, limit=15, filters=filters)
-    return templates.TemplateResponse("_quest_cards.html", {"request": request, "quests": quests})
+    if sort:
+        filters["sort"] = sort
+    limit = max(1, min(limit, CATALOG_MAX_PAGE_SIZE))
+
+    # При той же версии каталога и том же URL курсор продолжения тот же,
+    # браузер возьмёт X-Next-Cursor из своей закэшированной копии
+    etag = make_etag(request, "cards", f"c{catalog_version.value}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    quests, next_cursor = get_catalog_page(db, filters, skip, limit, cursor)
+    response = with_etag(templates.TemplateResponse("_quest_cards.html", {"request": request, "quests": quests}), etag)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+QUEST_FIELDS = tuple(QuestOut.model_fields)
+
+
+@app.get("/api/v1/quests")
+def api_v1_quests(request: Request, q: Optional[str] = None, genre: Optional[List[str]] = Query(None),
+                  difficulty: Optional[List[str]] = Query(None), fear_level: Optional[int] = None,
+                  players: Optional[int] = None, sort: Optional[str] = None,
+                  limit: int = CATALOG_PAGE_SIZE, cursor: Optional[str] = None,
+                  fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    JSON-каталог: {"items": [...], "total": N, "limit": L, "next_cursor": "..."}.
+    Поля квеста - из schemas.QuestOut, fields=title,price ограничивает набор (id есть всегда).
+    """
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in QUEST_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+        projection = ("id",) + tuple(f for f in selected if f != "id")
+    else:
+        projection = QUEST_FIELDS
+
+    filters = {}
+    if q:
+        filters["q"] = q
+    if genre:
+        filters["genre"] = genre
+    if difficulty:
+        filters["difficulty"] = difficulty
+    if fear_level:
+        filters["fear_level"] = fear_level
+    if players:
+        filters["players"] = players
+    if sort:
+        filters["sort"] = sort
+    limit = max(1, min(limit, CATALOG_MAX_PAGE_SIZE))
+
+    etag = make_etag(request, "json", f"c{catalog_version.value}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    quests, next_cursor = get_catalog_page(db, filters, 0, limit, cursor)
+    # Колонки квеста читаются напрямую: строки уже загружены, валидация pydantic не нужна
+    payload = {
+        "items": [{name: getattr(quest, name) for name in projection} for quest in quests],
+        "total": crud.count_quests(db, filters),
+        "limit": limit,
+        "next_cursor": next_cursor,
+    }
+    return with_etag(Response(content=dump_json(payload), media_type="application/json"), etag)
 
 
 @app.get("/quest/{quest_id}", response_class=HTMLResponse)
 def quest_detail(request: Request, quest_id: int, db: Session = Depends(get_db)):
+    # Страница зависит от квеста, его броней на сегодня и пользователя
+    today = datetime.now().strftime('%Y-%m-%d')
+    user_id = request.session.get("user_id")
+    held = crud.get_held_slots(quest_id, today, user_id=user_id)
+    etag = make_etag(request, f"quest{quest_id}", f"c{catalog_version.value}", f"b{bookings_version.value}", today,
+                     holds_tag(held))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     quest = crud.get_quest(db, quest_id)
     if not quest:
         raise HTTPException(status_code=404, detail="Quest not found")
 
     # Получаем занятые слоты для этого квеста
-    booked_slots = crud.get_booked_slots_for_date(db, quest_id, datetime.now().strftime('%Y-%m-%d'))
+    booked_slots = crud.get_booked_slots_for_date(db, quest_id, today, user_id=user_id, held=held)
 
     try:
         user = get_current_user(request, db)
     except:
         user = None
 
-    return templates.TemplateResponse("quest_detail.html", {
+    return with_etag(templates.TemplateResponse("quest_detail.html", {
         "request": request,
         "quest": quest,
         "user": user,
         "booked_slots": booked_slots,
+        "timeslots": crud.TIMESLOTS,
         "now": datetime.now
-    })
+    }), etag)
 
 
 @app.get("/api/available-slots")
-def get_available_slots(quest_id: int, date: str, db: Session = Depends(get_db)):
-    """API для получения занятых слотов"""
-    booked_slots = crud.get_booked_slots_for_date(db, quest_id, date)
+def get_available_slots(request: Request, quest_id: int, date: str, db: Session = Depends(get_db)):
+    """API для получения занятых слотов (включая удерживаемые другими)"""
+    booked_slots = crud.get_booked_slots_for_date(db, quest_id, date, user_id=request.session.get("user_id"))
     return JSONResponse(booked_slots)
 
 
+@app.get("/api/availability")
+def get_availability(request: Request, quest_id: int, date_from: str, date_to: str, db: Session = Depends(get_db)):
+    """API занятости квеста по дням за период (до месяца с небольшим) одним запросом; удержания - как занятые"""
+    try:
+        held = crud.get_held_slots(quest_id, date_from, date_to, user_id=request.session.get("user_id"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    etag = make_etag(request, f"avail{quest_id}", f"b{bookings_version.value}", date_from, date_to, holds_tag(held))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    days = crud.get_availability(db, quest_id, date_from, date_to, held=held)
+    return with_etag(JSONResponse({
+        "quest_id": quest_id,
+        "timeslots": crud.TIMESLOTS,
+        "days": days,
+    }), etag)
+
+
+@app.get("/api/v1/availability/search")
+def api_v1_availability_search(request: Request, date: str, time_from: Optional[str] = None,
+                               time_to: Optional[str] = None, genre: Optional[List[str]] = Query(None),
+                               difficulty: Optional[List[str]] = Query(None), fear_level: Optional[int] = None,
+                               players: Optional[int] = None, group_size: Optional[int] = None,
+                               limit: int = 30, db: Session = Depends(get_db)):
+    """Какие квесты свободны в дату/окно времени: {"items": [{...квест, "free_slots": [...]}]}"""
+    filters = {}
+    if genre:
+        filters["genre"] = genre
+    if difficulty:
+        filters["difficulty"] = difficulty
+    if fear_level:
+        filters["fear_level"] = fear_level
+    if players:
+        filters["players"] = players
+    limit = max(1, min(limit, CATALOG_MAX_PAGE_SIZE))
+
+    try:
+        found = crud.search_available_quests(db, date, time_from, time_to, filters=filters,
+                                             group_size=group_size, limit=limit,
+                                             user_id=request.session.get("user_id"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректная дата или время")
+
+    # Удержания меняются без записи в базу и без версий данных: ETag - по найденным слотам
+    found_tag = zlib.crc32(repr([(quest.id, free_slots) for quest, free_slots in found]).encode())
+    etag = make_etag(request, "availsearch", f"c{catalog_version.value}", f"s{found_tag:x}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    items = []
+    for quest, free_slots in found:
+        item = {name: getattr(quest, name) for name in QUEST_FIELDS}
+        item["free_slots"] = free_slots
+        items.append(item)
+    return with_etag(Response(content=dump_json({"date": date, "items": items}), media_type="application/json"), etag)
+
+
+SSE_HEARTBEAT_SECONDS = 15
+
+
+@app.get("/api/slots/stream")
+async def slots_stream(request: Request, quest_id: int, date: str):
+    """Server-Sent Events: изменения слотов квеста на дату (booked / released)"""
+    subscription = await events.broker.subscribe(events.slot_channel(quest_id, date))
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                message = await subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ": ping\n\n"  # держим соединение живым через прокси
+                else:
+                    yield f"data: {json.dumps(message, ensure_ascii=False)}\n\n"
+        finally:
+            await subscription.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/api/slots/hold")
+def hold_slot(request: Request, quest_id: int = Form(...), date: str = Form(...), timeslot: str = Form(...),
+              db: Session = Depends(get_db)):
+    """Временно удерживает слот за пользователем на время оформления"""
+    user = get_current_user(request, db)
+    try:
+        held = crud.hold_slot(db, user.id, quest_id, date, timeslot)
+    except ValueError as e:
+        return JSONResponse({"success": False, "message": str(e)}, status_code=400)
+    if not held:
+        return JSONResponse({"success": False, "message": "Выбранный слот уже занят"}, status_code=409)
+    return JSONResponse({"success": True, "expires_in": holds.HOLD_TTL_SECONDS})
+
+
+@app.post("/api/slots/release")
+def release_slot(request: Request, quest_id: int = Form(...), date: str = Form(...), timeslot: str = Form(...),
+                 db: Session = Depends(get_db)):
+    """Снимает удержание слота"""
+    user = get_current_user(request, db)
+    try:
+        released = crud.release_slot(user.id, quest_id, date, timeslot)
+    except ValueError:
+        return JSONResponse({"success": False, "message": "Некорректная дата или время"}, status_code=400)
+    return JSONResponse({"success": released})
+
+
 @app.post("/book")
 def book(request: Request, quest_id: int = Form(...), date: str = Form(...), timeslot: str = Form(...),
          db: Session = Depends(get_db)):
     user = get_current_user(request, db)
-    booking = crud.create_booking(db, user_id=user.id, quest_id=quest_id, date=date, timeslot=timeslot)
+    try:
+        booking = crud.create_booking(db, user_id=user.id, quest_id=quest_id, date=date, timeslot=timeslot)
+    except ValueError:
+        return JSONResponse({"success": False, "message": "Некорректная дата или время"}, status_code=400)
     if not booking:
         return JSONResponse({"success": False, "message": "Выбранный слот уже занят"}, status_code=400)
     return JSONResponse({"success": True, "message": "Бронь успешно создана"})
 
 
+@app.post("/api/v1/bookings/batch")
+def book_batch(request: Request, payload: BookingBatchCreate, db: Session = Depends(get_db)):
+    """Групповое бронирование: все слоты одной транзакцией или ни одного"""
+    user = get_current_user(request, db)
+    if not payload.slots:
+        return JSONResponse({"success": False, "message": "Не выбрано ни одного слота"}, status_code=400)
+    if len(payload.slots) > crud.MAX_BATCH_SLOTS:
+        return JSONResponse({"success": False,
+                             "message": f"Не больше {crud.MAX_BATCH_SLOTS} слотов за раз"}, status_code=400)
+
+    success, results = crud.create_bookings_batch(
+        db, user.id, [(slot.quest_id, slot.date, slot.timeslot) for slot in payload.slots]
+    )
+    if success:
+        return JSONResponse({"success": True, "message": "Брони успешно созданы", "results": results})
+
+    conflict = any(result["status"] in ("conflict", "held") for result in results)
+    return JSONResponse({
+        "success": False,
+        "message": "Часть слотов уже занята" if conflict else "Некорректные слоты в запросе",
+        "results": results
+    }, status_code=409 if conflict else 400)
+
+
 @app.get("/my-bookings", response_class=HTMLResponse)
 def my_bookings(request: Request, db: Session = Depends(get_db)):
     """Страница с бронированиями пользователя"""
@@ -269,11 +538,38 @@ def login_get(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 
+def auth_busy_response(template: str, request: Request):
+    return templates.TemplateResponse(template, {
+        "request": request,
+        "error": "Сервер перегружен входами, повторите через несколько секунд"
+    }, status_code=503, headers={"Retry-After": "5"})
+
+
+def find_user(db: Session, **filters):
+    return db.query(models.User).filter_by(**filters).first()
+
+
+def save_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+
+
 @app.post("/login")
-def login_post(request: Request, username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(username=username).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def login_post(request: Request, username: str = Form(...), password: str = Form(...),
+                     db: Session = Depends(get_db)):
+    # bcrypt - в пуле hash_pool (auth.py), запросы к базе - в threadpool: цикл событий не блокируется
+    user = await run_in_threadpool(find_user, db, username=username)
+    if not user:
+        return templates.TemplateResponse("login.html", {"request": request, "error": "Неверные учётные данные"})
+    try:
+        valid, new_hash = await verify_password_async(password, user.hashed_password)
+    except PoolBusy:
+        return auth_busy_response("login.html", request)
+    if not valid:
         return templates.TemplateResponse("login.html", {"request": request, "error": "Неверные учётные данные"})
+    if new_hash:
+        # Хеш со старой стоимостью bcrypt - сохраняем пересчитанный
+        await run_in_threadpool(save_password_hash, db, user, new_hash)
     request.session["user_id"] = user.id
     return RedirectResponse("/", status_code=303)
 
@@ -283,59 +579,64 @@ def register_get(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
 
-@app.post("/register")
-def register_post(request: Request, username: str = Form(...), email: str = Form(None), password: str = Form(...),
-                  db: Session = Depends(get_db)):
+def registration_error(db: Session, username: str, email: Optional[str], password: str) -> Optional[str]:
+    """Текст ошибки регистрации или None, если данные в порядке"""
     # Проверяем, не существует ли пользователь с таким username
-    existing_username = db.query(models.User).filter_by(username=username).first()
-    if existing_username:
-        return templates.TemplateResponse("register.html", {
-            "request": request,
-            "error": "Пользователь с таким именем уже существует"
-        })
+    if find_user(db, username=username):
+        return "Пользователь с таким именем уже существует"
 
     # Если email указан, проверяем его уникальность
-    if email:
-        existing_email = db.query(models.User).filter_by(email=email).first()
-        if existing_email:
-            return templates.TemplateResponse("register.html", {
-                "request": request,
-                "error": "Пользователь с таким email уже существует"
-            })
+    if email and find_user(db, email=email):
+        return "Пользователь с таким email уже существует"
 
     # Проверяем длину пароля
     if len(password) < 4:
-        return templates.TemplateResponse("register.html", {
-            "request": request,
-            "error": "Пароль должен содержать минимум 4 символа"
-        })
+        return "Пароль должен содержать минимум 4 символа"
 
     # Проверяем длину имени пользователя
     if len(username) < 3:
-        return templates.TemplateResponse("register.html", {
-            "request": request,
-            "error": "Имя пользователя должно содержать минимум 3 символа"
-        })
+        return "Имя пользователя должно содержать минимум 3 символа"
+    return None
 
+
+def create_user(db: Session, username: str, email: Optional[str], hashed_password: str) -> Optional[int]:
+    """id нового пользователя или None, если имя или email уже заняты"""
     try:
         u = models.User(
             username=username,
             email=email if email else None,
-            hashed_password=hash_password(password),
+            hashed_password=hashed_password,
             is_admin=False
         )
         db.add(u)
         db.commit()
         db.refresh(u)
-        request.session["user_id"] = u.id
-        return RedirectResponse("/", status_code=303)
-
+        return u.id
     except IntegrityError:
         db.rollback()
+        return None
+
+
+@app.post("/register")
+async def register_post(request: Request, username: str = Form(...), email: str = Form(None), password: str = Form(...),
+                  db: Session = Depends(get_db)):
+    error = await run_in_threadpool(registration_error, db, username, email, password)
+    if error:
+        return templates.TemplateResponse("register.html", {"request": request, "error": error})
+
+    try:
+        hashed_password = await hash_password_async(password)
+    except PoolBusy:
+        return auth_busy_response("register.html", request)
+
+    user_id = await run_in_threadpool(create_user, db, username, email, hashed_password)
+    if user_id is None:
         return templates.TemplateResponse("register.html", {
             "request": request,
             "error": "Произошла ошибка при создании пользователя. Попробуйте другое имя или email."
         })
+    request.session["user_id"] = user_id
+    return RedirectResponse("/", status_code=303)
 
 
 @app.get("/logout")
@@ -351,11 +652,23 @@ def admin_dashboard(request: Request, db: Session = Depends(get_db), user=Depend
     return templates.TemplateResponse("admin_dashboard.html", {
         "request": request,
         "quests": quests,
+        "stats": crud.get_booking_stats(db),
         "user": user,
         "now": datetime.now
     })
 
 
+@app.get("/admin/stats")
+def admin_stats(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                db: Session = Depends(get_db), user=Depends(require_admin)):
+    """Выручка и загрузка из свёрток статистики в JSON"""
+    try:
+        stats = crud.get_booking_stats(db, date_from, date_to)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный период")
+    return Response(content=dump_json(stats), media_type="application/json")
+
+
 @app.get("/admin/add", response_class=HTMLResponse)
 def add_get(request: Request, user=Depends(require_admin)):
     return templates.TemplateResponse("add_quest.html", {"request": request, "user": user})
@@ -405,19 +718,18 @@ def add_post(request: Request,
     elif image and image.filename:
         image_path = save_upload(image)
 
-    genre_str = ", ".join(genres)
 
     new_quest = models.Quest(
         title=title,
         description=description,
         organizer_email=organizer_email,
         price=price,
-        genre=genre_str,
         difficulty=difficulty,
         fear_level=fear_level,
         players=players,
         image_path=image_path
     )
+    crud.set_quest_genres(new_quest, genres)
 
     db.add(new_quest)
     db.commit()
@@ -492,13 +804,12 @@ def edit_post(request: Request,
         image_path = save_upload(image)
         quest.image_path = image_path
 
-    genre_str = ", ".join(genres)
 
     quest.title = title
     quest.description = description
     quest.organizer_email = organizer_email
     quest.price = price
-    quest.genre = genre_str
+    crud.set_quest_genres(quest, genres)
     quest.difficulty = difficulty
     quest.fear_level = fear_level
     quest.players = players
@@ -537,21 +848,44 @@ def admin_delete(request: Request, quest_id: int, db: Session = Depends(get_db),
     return RedirectResponse("/admin", status_code=303)
 
 
+ADMIN_BOOKINGS_PER_PAGE = 50
+
+
 @app.get("/admin/bookings", response_class=HTMLResponse)
-def admin_bookings(request: Request, quest_id: Optional[int] = None, db: Session = Depends(get_db),
-                   user=Depends(require_admin)):
-    """Страница управления бронированиями для администратора"""
-    if quest_id:
-        bookings = crud.get_quest_bookings(db, quest_id)
-    else:
-        bookings = crud.get_all_bookings(db)
+def admin_bookings(request: Request, quest_id: Optional[str] = None, user_filter: Optional[str] = Query(None, alias="user"),
+                   date_from: Optional[str] = None, date_to: Optional[str] = None,
+                   sort: Optional[str] = None, page: int = 1,
+                   db: Session = Depends(get_db), user=Depends(require_admin)):
+    """Страница управления бронированиями для администратора (постранично, фильтры в БД)"""
+    # Пустые поля формы фильтра приходят как ""
+    filters = {
+        "quest_id": int(quest_id) if quest_id and quest_id.isdigit() else None,
+        "user": user_filter,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+    page = max(page, 1)
+    try:
+        bookings, total = crud.get_bookings_page(db, filters, sort=sort, page=page,
+                                                 per_page=ADMIN_BOOKINGS_PER_PAGE)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректная дата")
 
-    # Получаем все квесты для фильтра
-    quests = crud.get_quests(db, skip=0, limit=1000, filters={})
+    # Лёгкий закэшированный список квестов для фильтра
+    quests = crud.get_quest_options(db)
+
+    # Параметры текущего фильтра для ссылок пагинации
+    query_params = {k: v for k, v in request.query_params.items() if k != "page"}
+    pages = max(1, -(-total // ADMIN_BOOKINGS_PER_PAGE))
 
     return templates.TemplateResponse("admin_bookings.html", {
         "request": request,
         "bookings": bookings,
+        "total": total,
+        "page": page,
+        "pages": pages,
+        "page_query": urllib.parse.urlencode(query_params),
+        "sort": sort or crud.DEFAULT_BOOKING_SORT,
         "quests": quests,
         "user": user,
         "now": datetime.now
@@ -592,6 +926,17 @@ def admin_delete_booking(booking_id: int, db: Session = Depends(get_db), user=De
     return RedirectResponse("/admin/bookings", status_code=303)
 
 
+@app.get("/admin/cache-stats")
+def admin_cache_stats(user=Depends(require_admin)):
+    """Счётчики кэшей каталога и отчетов"""
+    return JSONResponse({
+        "catalog_version": catalog_version.value,
+        "catalog_cache": catalog_cache.stats(),
+        "quest_card_cache": quest_card_cache.stats(),
+        "report_cache": report_cache.stats(),
+    })
+
+
 @app.get("/api/quest-has-bookings/{quest_id}")
 def api_quest_has_bookings(quest_id: int, db: Session = Depends(get_db)):
     """API для проверки наличия бронирований у квеста"""
@@ -601,676 +946,236 @@ def api_quest_has_bookings(quest_id: int, db: Session = Depends(get_db)):
 
 # --- Отчеты ---
 @app.get("/admin/report/excel")
-async def report_excel(db: Session = Depends(get_db), user=Depends(require_admin)):
-    """Генерация отчета в Excel с логотипом и печатью"""
-    bookings = crud.get_all_bookings(db)
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Отчет по бронированиям"
-
-    # Стили
-    header_font = Font(bold=True, size=16)
-    title_font = Font(bold=True, size=12)
-    normal_font = Font(size=10)
-    bold_font = Font(bold=True, size=10)
-
-    center_align = Alignment(horizontal='center', vertical='center')
-    left_align = Alignment(horizontal='left', vertical='center')
-
-    # Добавляем логотип
-    try:
-        logo_path = "static/images/logo_black.png"
-        if os.path.exists(logo_path):
-            from openpyxl.drawing.image import Image as XLImage
-            logo = XLImage(logo_path)
-            logo.width = 80
-            logo.height = 80
-            ws.add_image(logo, 'A1')
-    except:
-        pass
-
-    # Шапка документа (смещаем из-за логотипа)
-    ws.merge_cells('D1:F1')
-    ws['D1'] = "Алиби"
-    ws['D1'].font = Font(bold=True, size=18)
-    ws['D1'].alignment = center_align
-
-    ws.merge_cells('D2:F2')
-    ws['D2'] = "РОССИЯ, 125009, г.Москва, ул.Квестовая, д.88"
-    ws['D2'].font = normal_font
-    ws['D2'].alignment = center_align
-
-    ws.merge_cells('D3:F3')
-    ws['D3'] = "Телефон: +7(999) 999-99-99"
-    ws['D3'].font = normal_font
-    ws['D3'].alignment = center_align
-
-    ws.merge_cells('D4:F4')
-    ws['D4'] = "e-mail: alibi@mail.ru"
-    ws['D4'].font = normal_font
-    ws['D4'].alignment = center_align
-
-    # Пустая строка
-    ws.row_dimensions[5].height = 15
-
-    # Заголовок отчета
-    ws.merge_cells('A6:F6')
-    ws['A6'] = "ОТЧЕТ ПО БРОНИРОВАНИЯМ"
-    ws['A6'].font = Font(bold=True, size=14)
-    ws['A6'].alignment = center_align
-
-    # Информация о документе
-    ws.merge_cells('A7:F7')
-    ws['A7'] = f"Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
-    ws['A7'].font = normal_font
-    ws['A7'].alignment = center_align
-
-    # Пустая строка
-    ws.row_dimensions[9].height = 15
-
-    # Заголовки таблицы
-    headers = ['№', 'Пользователь', 'Email пользователя', 'Название квеста', 'Email организатора', 'Цена (руб)']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=10, column=col, value=header)
-        cell.font = bold_font
-        cell.alignment = center_align
-        cell.fill = PatternFill(start_color="E6E6FA", end_color="E6E6FA", fill_type="solid")
-        cell.border = Border(left=Side(style='thin'), right=Side(style='thin'),
-                             top=Side(style='thin'), bottom=Side(style='thin'))
-
-    # Данные бронирований
-    total_revenue = 0
-    for row, booking in enumerate(bookings, 11):
-        ws.cell(row=row, column=1, value=row - 10).alignment = center_align
-        ws.cell(row=row, column=2, value=booking.user.username).alignment = left_align
-        ws.cell(row=row, column=3, value=booking.user.email or 'Не указан').alignment = left_align
-        ws.cell(row=row, column=4, value=booking.quest.title).alignment = left_align
-        ws.cell(row=row, column=5, value=booking.quest.organizer_email).alignment = left_align
-        ws.cell(row=row, column=6, value=booking.quest.price).alignment = center_align
-
-        # Добавляем границы для всех ячеек
-        for col in range(1, 7):
-            ws.cell(row=row, column=col).border = Border(left=Side(style='thin'), right=Side(style='thin'),
-                                                         top=Side(style='thin'), bottom=Side(style='thin'))
-
-        total_revenue += booking.quest.price
-
-    # Итоговая строка
-    last_row = len(bookings) + 11
-    ws.merge_cells(f'A{last_row}:E{last_row}')
-    ws[f'A{last_row}'] = "ИТОГО:"
-    ws[f'A{last_row}'].font = bold_font
-    ws[f'A{last_row}'].alignment = Alignment(horizontal='right', vertical='center')
-    ws[f'A{last_row}'].fill = PatternFill(start_color="FFFFE0", end_color="FFFFE0", fill_type="solid")
-
-    ws[f'F{last_row}'] = f"{total_revenue} руб"
-    ws[f'F{last_row}'].font = bold_font
-    ws[f'F{last_row}'].alignment = center_align
-    ws[f'F{last_row}'].fill = PatternFill(start_color="FFFFE0", end_color="FFFFE0", fill_type="solid")
-
-    # Добавляем границы для итоговой строки
-    for col in range(1, 7):
-        ws.cell(row=last_row, column=col).border = Border(left=Side(style='thin'), right=Side(style='thin'),
-                                                          top=Side(style='thin'), bottom=Side(style='thin'))
-
-    # Статистика
-    stats_row = last_row + 2
-    ws.merge_cells(f'A{stats_row}:F{stats_row}')
-    ws[f'A{stats_row}'] = f"Всего бронирований: {len(bookings)} | Общая выручка: {total_revenue} руб"
-    ws[f'A{stats_row}'].font = bold_font
-    ws[f'A{stats_row}'].alignment = center_align
-
-    # Добавляем печать
-    try:
-        stamp_path = "static/images/stamp.png"
-        if os.path.exists(stamp_path):
-            from openpyxl.drawing.image import Image as XLImage
-            stamp = XLImage(stamp_path)
-            stamp.width = 80
-            stamp.height = 80
-            # Размещаем печать справа внизу
-            stamp_cell = f'F{stats_row + 4}'
-            ws.add_image(stamp, stamp_cell)
-    except:
-        pass
-
-    # Место для подписи
-    sign_row = stats_row + 6
-    ws.merge_cells(f'A{sign_row}:F{sign_row}')
-    ws[f'A{sign_row}'] = "_________________________"
-    ws[f'A{sign_row}'].alignment = center_align
-
-    ws.merge_cells(f'A{sign_row + 1}:F{sign_row + 1}')
-    ws[f'A{sign_row + 1}'] = "Подпись ответственного лица"
-    ws[f'A{sign_row + 1}'].alignment = center_align
-    ws[f'A{sign_row + 1}'].font = normal_font
-
-    # Настройка ширины колонок
-    column_widths = [8, 20, 25, 30, 25, 15]
-    for i, width in enumerate(column_widths, 1):
-        ws.column_dimensions[get_column_letter(i)].width = width
-
-    # Настройка высоты строк
-    for row in range(1, sign_row + 2):
-        if row in [1, 6, 10]:
-            ws.row_dimensions[row].height = 25
-        else:
-            ws.row_dimensions[row].height = 18
-
-    # Сохраняем в буфер
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-
+def report_excel(user=Depends(require_admin)):
+    """Отчет в Excel с логотипом и печатью: строки уходят клиенту по мере чтения из базы"""
     filename = f"otchet_bronirovaniya_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
     encoded_filename = urllib.parse.quote(filename)
 
     return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        excel_report_chunks(),
+        media_type=reports.EXCEL_MEDIA_TYPE,
         headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
     )
 
 
-@app.get("/admin/report/pdf")
-async def report_pdf(db: Session = Depends(get_db), user=Depends(require_admin)):
-    """Генерация отчета в PDF с поддержкой кириллицы"""
-    bookings = crud.get_all_bookings(db)
+def excel_report_chunks():
+    # Своя сессия: тело ответа читается уже после выхода из обработчика
+    db = SessionLocal()
+    try:
+        yield from reports.stream_bookings_excel(crud.iter_report_rows(db))
+    finally:
+        db.close()
 
-    buffer = io.BytesIO()
 
-    # Используем ReportLab с правильной кодировкой
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
+@app.get("/admin/report/pdf")
+async def report_pdf(user=Depends(require_admin)):
+    """Отчет в PDF через очередь отчетов (ожидание не блокирует цикл событий)"""
+    return await report_response("pdf", {})
 
-    # Регистрируем шрифт с поддержкой кириллицы (если есть)
-    try:
-        # Попробуем найти стандартные шрифты с кириллицей
-        pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
-        pdfmetrics.registerFont(TTFont('Arial-Bold', 'arialbd.ttf'))
-        font_name = 'Arial'
-    except:
-        try:
-            pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', 'DejaVuSans-Bold.ttf'))
-            font_name = 'DejaVuSans'
-        except:
-            font_name = 'Helvetica'  # Базовый шрифт
-
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=40,
-        leftMargin=40,
-        topMargin=60,
-        bottomMargin=40
-    )
 
-    styles = getSampleStyleSheet()
-
-    # Создаем кастомные стили для русского текста
-    styles.add(ParagraphStyle(
-        name='Russian',
-        fontName=font_name,
-        fontSize=10,
-        leading=12,
-    ))
-    styles.add(ParagraphStyle(
-        name='RussianBold',
-        fontName=f'{font_name}-Bold' if font_name != 'Helvetica' else 'Helvetica-Bold',
-        fontSize=10,
-        leading=12,
-    ))
-    styles.add(ParagraphStyle(
-        name='RussianTitle',
-        fontName=f'{font_name}-Bold' if font_name != 'Helvetica' else 'Helvetica-Bold',
-        fontSize=16,
-        leading=18,
-        alignment=1,  # center
-    ))
-    styles.add(ParagraphStyle(
-        name='RussianHeading',
-        fontName=f'{font_name}-Bold' if font_name != 'Helvetica' else 'Helvetica-Bold',
-        fontSize=14,
-        leading=16,
-        alignment=1,  # center
-    ))
-
-    story = []
-
-    # Добавляем логотип
-    try:
-        logo_path = "static/images/logo_black.png"
-        if os.path.exists(logo_path):
-            from reportlab.platypus import Image
-            logo = Image(logo_path, width=80, height=80)
-            logo.hAlign = 'LEFT'
-            story.append(logo)
-            story.append(Spacer(1, 10))
-    except:
-        pass
-
-    # Шапка документа
-    story.append(Paragraph("Алиби", styles['RussianTitle']))
-    story.append(Paragraph("РОССИЯ, 125009, г.Москва, ул.Квестовая, д.88", styles['Russian']))
-    story.append(Paragraph("Телефон: +7(999) 999-99-99", styles['Russian']))
-    story.append(Paragraph("e-mail: alibi@mail.ru", styles['Russian']))
-    story.append(Spacer(1, 12))
-
-    # Заголовок отчета
-    story.append(Paragraph("ОТЧЕТ ПО БРОНИРОВАНИЯМ", styles['RussianHeading']))
-    story.append(Paragraph(f"Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}", styles['Russian']))
-    story.append(Spacer(1, 20))
-
-    # Таблица с данными
-    if bookings:
-        # Заголовки таблицы
-        data = [['№', 'Пользователь', 'Квест', 'Цена (руб)']]
-
-        total_revenue = 0
-        for i, booking in enumerate(bookings, 1):
-            data.append([
-                str(i),
-                booking.user.username or 'Не указан',
-                booking.quest.title,
-                f"{booking.quest.price} руб"
-            ])
-            total_revenue += booking.quest.price
-
-        # Создаем таблицу
-        table = Table(data, colWidths=[30, 120, 200, 60])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#E6E6FA')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('ALIGN', (1, 1), (2, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), f'{font_name}-Bold' if font_name != 'Helvetica' else 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('FONTNAME', (0, 1), (-1, -1), font_name),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-
-        story.append(table)
-        story.append(Spacer(1, 20))
-
-        # Итоги
-        story.append(Paragraph(f"Всего бронирований: {len(bookings)}", styles['RussianBold']))
-        story.append(Paragraph(f"Общая выручка: {total_revenue} руб", styles['RussianBold']))
-    else:
-        story.append(Paragraph("Нет данных о бронированиях", styles['Russian']))
+@app.get("/admin/report/word")
+async def report_word(user=Depends(require_admin)):
+    """Отчет в Word через очередь отчетов"""
+    return await report_response("word", {})
 
-    story.append(Spacer(1, 30))
 
-    # Добавляем печать
+async def report_response(report_format: str, filters: dict):
+    # submit читает версии данных (в Redis при нескольких воркерах) - не блокируем цикл событий
+    job = await run_in_threadpool(jobs.report_queue.submit, report_format, filters)
     try:
-        stamp_path = "static/images/stamp.png"
-        if os.path.exists(stamp_path):
-            from reportlab.platypus import Image
-            stamp = Image(stamp_path, width=80, height=80)
-            stamp.hAlign = 'RIGHT'
-            story.append(stamp)
-    except:
-        pass
+        content = await asyncio.wrap_future(job.future)
+    except Exception:
+        return JSONResponse({"message": "Не удалось сформировать отчет"}, status_code=500)
+    return report_file(report_format, content)
 
-    # Подпись
-    story.append(Spacer(1, 10))
-    story.append(Paragraph("_________________________", styles['Russian']))
-    story.append(Paragraph("Подпись ответственного лица", styles['Russian']))
 
-    doc.build(story)
-    buffer.seek(0)
-
-    filename = f"otchet_bronirovaniya_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-    encoded_filename = urllib.parse.quote(filename)
-
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
+def report_file(report_format: str, content: bytes):
+    encoded_filename = urllib.parse.quote(reports.report_filename(report_format))
+    return Response(
+        content=content,
+        media_type=reports.REPORT_FORMATS[report_format][1],
         headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
     )
 
 
-@app.get("/admin/report/word")
-async def report_word(db: Session = Depends(get_db), user=Depends(require_admin)):
-    """Генерация отчета в Word с логотипом и печатью"""
+def booking_filters(quest_id: Optional[str], date_from: Optional[str], date_to: Optional[str]) -> dict:
+    """Фильтры отчетов и выгрузок; пустые значения из форм отбрасываются, неверная дата -> 400"""
+    filters = {
+        "quest_id": int(quest_id) if quest_id and quest_id.isdigit() else None,
+        "date_from": date_from or None,
+        "date_to": date_to or None,
+    }
+    for value in (filters["date_from"], filters["date_to"]):
+        if value:
+            try:
+                datetime.strptime(value, crud.SLOT_DATE_FORMAT)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Некорректная дата")
+    return filters
+
+
+# --- Фоновые отчеты: поставить в очередь, опросить статус, скачать ---
+@app.post("/admin/reports")
+def submit_report(report_format: str = Form(..., alias="format"), quest_id: Optional[str] = Form(None),
+                  date_from: Optional[str] = Form(None), date_to: Optional[str] = Form(None),
+                  user=Depends(require_admin)):
+    """Ставит отчет в очередь, возвращает id задачи (готовый отчет с теми же данными - сразу из кэша)"""
+    if report_format not in reports.REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Неизвестный формат отчета")
+    job = jobs.report_queue.submit(report_format, booking_filters(quest_id, date_from, date_to))
+    return JSONResponse(job.to_dict(), status_code=202)
+
+
+@app.get("/admin/reports/{job_id}")
+def report_status(job_id: str, user=Depends(require_admin)):
+    job = jobs.report_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return JSONResponse(job.to_dict())
+
+
+@app.get("/admin/reports/{job_id}/download")
+def report_download(job_id: str, user=Depends(require_admin)):
+    job = jobs.report_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    if job.status != "done":
+        return JSONResponse(job.to_dict(), status_code=409)
+    return report_file(job.format, job.future.result())
+
+
+# --- Выгрузка броней для бухгалтерии (CSV / NDJSON), потоком с серверного курсора ---
+@app.get("/admin/export/bookings.{export_format}")
+def export_bookings(export_format: str, quest_id: Optional[str] = None, date_from: Optional[str] = None,
+                    date_to: Optional[str] = None, user_filter: Optional[str] = Query(None, alias="user"),
+                    gzip: bool = False, user=Depends(require_admin)):
+    """
+    Все брони по фильтрам списка броней (user - начало имени) в порядке id; sort списка не применяется.
+    gzip=true - ответ сжимается на лету (Content-Encoding: gzip)
+    """
+    if export_format not in exports.EXPORT_FORMATS:
+        raise HTTPException(status_code=404, detail="Неизвестный формат выгрузки")
+    filters = booking_filters(quest_id, date_from, date_to)
+    filters["user"] = user_filter or None
+
+    filename = f"bookings_{datetime.now().strftime('%Y%m%d_%H%M')}.{export_format}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_bookings_chunks(export_format, filters, gzip),
+                             media_type=exports.EXPORT_FORMATS[export_format], headers=headers)
+
+
+def export_bookings_chunks(export_format: str, filters: dict, gzip: bool):
+    # Своя сессия, как у excel_report_chunks: строки читаются после выхода из обработчика
+    db = SessionLocal()
     try:
-        bookings = crud.get_all_bookings(db)
-
-        doc = Document()
+        rows = crud.iter_export_rows(db, filters)
+        yield from exports.export_chunks(export_format, crud.EXPORT_COLUMNS, rows, gzip=gzip)
+    finally:
+        db.close()
 
-        # Настройка стилей
-        style = doc.styles['Normal']
-        font = style.font
-        font.name = 'Arial'
-        font.size = Pt(10)
 
-        # Создаем таблицу для шапки с логотипом
-        header_table = doc.add_table(rows=1, cols=2)
-        header_table.autofit = False
-        header_table.columns[0].width = Inches(1.5)
-        header_table.columns[1].width = Inches(4.5)
+# --- Заявление и чек (рендер в пуле render_pool, цикл событий не блокируется) ---
+def render_busy_response():
+    return JSONResponse({"message": "Сервер занят формированием документов, повторите через несколько секунд"},
+                        status_code=503, headers={"Retry-After": "5"})
 
-        # Добавляем логотип в первую ячейку
-        try:
-            logo_path = "static/images/logo_black.png"
-            if os.path.exists(logo_path):
-                logo_cell = header_table.cell(0, 0)
-                logo_paragraph = logo_cell.paragraphs[0]
-                logo_run = logo_paragraph.add_run()
-                logo_run.add_picture(logo_path, width=Inches(1.8), height=Inches(1.8))
-        except:
-            pass
-
-        # Добавляем информацию во вторую ячейку
-        info_cell = header_table.cell(0, 1)
-        info_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-        info_cell.paragraphs[0].add_run("Алиби\n").bold = True
-        info_cell.paragraphs[0].add_run("РОССИЯ, 125009, г.Москва, ул.Квестовая, д.88\n")
-        info_cell.paragraphs[0].add_run("Телефон: +7(999) 999-99-99\n")
-        info_cell.paragraphs[0].add_run("e-mail: alibi@mail.ru")
-
-        doc.add_paragraph()
-
-        # Заголовок отчета
-        report_title = doc.add_paragraph("ОТЧЕТ ПО БРОНИРОВАНИЯМ")
-        report_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        report_title.runs[0].bold = True
-        report_title.runs[0].font.size = Pt(14)
-
-        # Дата формирования
-        date_para = doc.add_paragraph(f"Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}")
-        date_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-        doc.add_paragraph()
-
-        # Создаем таблицу с данными
-        if bookings:
-            table = doc.add_table(rows=1, cols=4)
-            table.style = 'Table Grid'
-            table.autofit = False
-            table.columns[0].width = Inches(0.5)   # №
-            table.columns[1].width = Inches(1.5)   # Пользователь
-            table.columns[2].width = Inches(2.5)   # Квест
-            table.columns[3].width = Inches(1.0)   # Цена
-
-            # Заголовки таблицы
-            headers = ['№', 'Пользователь', 'Квест', 'Цена (руб)']
-            hdr_cells = table.rows[0].cells
-            for i, header in enumerate(headers):
-                hdr_cells[i].text = header
-                hdr_cells[i].paragraphs[0].runs[0].bold = True
-                hdr_cells[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                # Заливаем фон заголовков
-                shading_elm = parse_xml(r'<w:shd {} w:fill="E6E6FA"/>'.format(nsdecls('w')))
-                hdr_cells[i]._tc.get_or_add_tcPr().append(shading_elm)
-
-            # Данные
-            total_revenue = 0
-            for i, booking in enumerate(bookings, 1):
-                row_cells = table.add_row().cells
-                row_cells[0].text = str(i)
-                row_cells[0].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-                row_cells[1].text = booking.user.username or 'Не указан'
-                row_cells[2].text = booking.quest.title
-
-                row_cells[3].text = str(booking.quest.price)
-                row_cells[3].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-                total_revenue += booking.quest.price
-
-            doc.add_paragraph()
-
-            # Итоги
-            total_para = doc.add_paragraph()
-            total_para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-            total_para.add_run(f"ИТОГО: {total_revenue} руб\n").bold = True
-            total_para.add_run(f"Всего бронирований: {len(bookings)} | Общая выручка: {total_revenue} руб").bold = True
-
-        else:
-            doc.add_paragraph("Нет данных о бронированиях")
-
-        doc.add_paragraph()
-        doc.add_paragraph()
-
-        # Создаем таблицу для подписи и печати
-        footer_table = doc.add_table(rows=1, cols=2)
-        footer_table.autofit = False
-        footer_table.columns[0].width = Inches(4.0)
-        footer_table.columns[1].width = Inches(2.0)
-
-        # Подпись в левой ячейке
-        sign_cell = footer_table.cell(0, 0)
-        sign_cell.paragraphs[0].add_run("_________________________\n")
-        sign_cell.paragraphs[0].add_run("Подпись ответственного лица")
-
-        # Печать в правой ячейке
-        try:
-            stamp_path = "static/images/stamp.png"
-            if os.path.exists(stamp_path):
-                stamp_cell = footer_table.cell(0, 1)
-                stamp_paragraph = stamp_cell.paragraphs[0]
-                stamp_paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-                stamp_run = stamp_paragraph.add_run()
-                stamp_run.add_picture(stamp_path, width=Inches(1.8), height=Inches(1.8))
-        except:
-            pass
-
-        # Сохраняем в буфер
-        buffer = io.BytesIO()
-        doc.save(buffer)
-        buffer.seek(0)
-
-        filename = f"otchet_bronirovaniya_{datetime.now().strftime('%Y%m%d_%H%M')}.docx"
-        encoded_filename = urllib.parse.quote(filename)
-
-        return StreamingResponse(
-            buffer,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
-        )
 
-    except ImportError:
-        return JSONResponse({"message": "Для генерации Word отчетов установите python-docx: pip install python-docx"})
+def document_response(content: bytes, media_type: str, filename: str):
+    encoded_filename = urllib.parse.quote(filename)
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
+    )
 
 
-# --- Заявление и чек ---
 @app.post("/download-statement")
 async def download_statement(request: Request, db: Session = Depends(get_db)):
     """Скачивание заявления об отказе от претензий через шаблон Word"""
-    user = get_current_user(request, db)
+    user = await run_in_threadpool(get_current_user, request, db)
     data = await request.json()
 
-    # Создаем шаблон если его нет
-    template_path = "templates/statement_template.docx"
-    if not os.path.exists(template_path):
-        create_statement_template()
-
-    # Открываем шаблон
-    doc = Document(template_path)
-
-    # Данные для замены
-    replacements = {
-        '{full_name}': data['full_name'],
-        '{passport_series}': data['passport_series'],
-        '{passport_number}': data['passport_number'],
-        '{current_date}': datetime.now().strftime('%d.%m.%Y'),
-        '{quest_title}': data.get('quest_title', '')
+    fields = {
+        'full_name': data['full_name'],
+        'passport_series': data['passport_series'],
+        'passport_number': data['passport_number'],
+        'quest_title': data.get('quest_title', ''),
     }
+    try:
+        content = await render_pool.pool.run(documents.render_statement, fields)
+    except PoolBusy:
+        return render_busy_response()
 
-    # Заменяем метки в документе
-    for paragraph in doc.paragraphs:
-        for key, value in replacements.items():
-            if key in paragraph.text:
-                for run in paragraph.runs:
-                    if key in run.text:
-                        run.text = run.text.replace(key, value)
-
-    # Также проверяем таблицы
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for run in paragraph.runs:
-                        for key, value in replacements.items():
-                            if key in run.text:
-                                run.text = run.text.replace(key, value)
-
-    # Сохраняем в буфер
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-
-    filename = f"zayavlenie_{data.get('quest_title', 'quest')}.docx"
-    encoded_filename = urllib.parse.quote(filename)
-
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
-    )
+    return document_response(content, documents.DOCX_MEDIA_TYPE, f"zayavlenie_{data.get('quest_title', 'quest')}.docx")
 
 
 @app.post("/download-receipt")
 async def download_receipt(request: Request, db: Session = Depends(get_db)):
     """Скачивание чека с поддержкой кириллицы"""
-    user = get_current_user(request, db)
+    user = await run_in_threadpool(get_current_user, request, db)
     data = await request.json()
 
-    buffer = io.BytesIO()
-
-    # Настройка шрифтов
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-
     try:
-        pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
-        pdfmetrics.registerFont(TTFont('Arial-Bold', 'arialbd.ttf'))
-        font_name = 'Arial'
-    except:
-        try:
-            pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', 'DejaVuSans-Bold.ttf'))
-            font_name = 'DejaVuSans'
-        except:
-            font_name = 'Helvetica'
-
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=40,
-        leftMargin=40,
-        topMargin=40,
-        bottomMargin=40
-    )
+        content = await render_pool.pool.run(documents.render_receipt, data['quest_title'], data['quest_price'],
+                                             user.username)
+    except PoolBusy:
+        return render_busy_response()
+
+    return document_response(content, documents.PDF_MEDIA_TYPE, f"chek_{data['quest_title']}.pdf")
+
+
+@app.get("/bookings/documents.zip")
+def booking_documents(request: Request, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                      quest_id: Optional[str] = None, user_filter: Optional[str] = Query(None, alias="user"),
+                      kinds: str = "receipt,statement", db: Session = Depends(get_db)):
+    """
+    Чеки и заявления по всем броням за период одним ZIP. Документы формируются на сервере по броням
+    в пуле рендера и отдаются архивом по мере готовности. Администратор выбирает пользователя
+    (user - начало имени, как в списке броней), остальные получают только свои брони.
+    """
+    user = get_current_user(request, db)
+    selected = tuple(kind for kind in documents.BOOKING_DOCUMENTS if kind in kinds.split(","))
+    if not selected:
+        raise HTTPException(status_code=400, detail="Не выбраны документы")
+    filters = booking_filters(quest_id, date_from, date_to)
+    if user.is_admin:
+        filters["user"] = user_filter or None
+    else:
+        filters["user_id"] = user.id
 
-    styles = getSampleStyleSheet()
-
-    # Создаем стили
-    styles.add(ParagraphStyle(
-        name='ReceiptTitle',
-        fontName=f'{font_name}-Bold' if font_name != 'Helvetica' else 'Helvetica-Bold',
-        fontSize=16,
-        leading=18,
-        alignment=1,
-    ))
-    styles.add(ParagraphStyle(
-        name='ReceiptText',
-        fontName=font_name,
-        fontSize=10,
-        leading=12,
-    ))
-    styles.add(ParagraphStyle(
-        name='ReceiptBold',
-        fontName=f'{font_name}-Bold' if font_name != 'Helvetica' else 'Helvetica-Bold',
-        fontSize=10,
-        leading=12,
-    ))
-
-    story = []
-
-    # Логотип
     try:
-        from reportlab.platypus import Image
-        logo_path = "static/images/logo_black.png"
-        if os.path.exists(logo_path):
-            logo = Image(logo_path, width=80, height=80)
-            logo.hAlign = 'LEFT'
-            story.append(logo)
-            story.append(Spacer(1, 10))
-    except:
-        pass
-
-    # Шапка чека
-    story.append(Paragraph("Алиби", styles['ReceiptTitle']))
-    story.append(Paragraph("Квест-проект", styles['ReceiptText']))
-    story.append(Spacer(1, 15))
-
-    # Реквизиты
-    story.append(Paragraph("Юридический адрес: 125009, г. Москва, ул. Квестовая, д. 88", styles['ReceiptText']))
-    story.append(Paragraph("ИНН: 7701234567", styles['ReceiptText']))
-    story.append(Paragraph("КПП: 770101001", styles['ReceiptText']))
-    story.append(Paragraph("ОГРН: 1234567890123", styles['ReceiptText']))
-    story.append(Paragraph("Р/с: 40702810123450123456", styles['ReceiptText']))
-    story.append(Paragraph('Банк: ПАО "СБЕРБАНК" г. Москва', styles['ReceiptText']))
-    story.append(Paragraph("БИК: 044525225", styles['ReceiptText']))
-    story.append(Paragraph("К/с: 30101810400000000225", styles['ReceiptText']))
-
-    story.append(Spacer(1, 15))
-
-    # Линия разделитель (имитация)
-    story.append(Paragraph("_" * 80, styles['ReceiptText']))
-    story.append(Spacer(1, 15))
-
-    # Информация о заказе
-    story.append(Paragraph("КАССОВЫЙ ЧЕК", styles['ReceiptBold']))
-    story.append(Spacer(1, 10))
+        # Место в пуле резервируется до ответа: если выгрузки заняли свою долю очереди - 503 сразу
+        files = render_pool.pool.imap(documents.render_booking_document, booking_document_tasks(selected, filters))
+    except PoolBusy:
+        return render_busy_response()
+    filename = f"documents_{datetime.now().strftime('%Y%m%d_%H%M')}.zip"
+    return StreamingResponse(exports.zip_chunks(files), media_type="application/zip",
+                             headers={"Content-Disposition": f"attachment; filename={filename}"})
 
-    story.append(Paragraph(f"Заказ: {data['quest_title']}", styles['ReceiptText']))
-    story.append(Paragraph(f"Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}", styles['ReceiptText']))
-    story.append(Paragraph(f"Клиент: {user.username}", styles['ReceiptText']))
-    story.append(Spacer(1, 10))
 
-    # Сумма
-    story.append(Paragraph(f"Сумма: {data['quest_price']} руб.", styles['ReceiptBold']))
-    story.append(Spacer(1, 10))
-
-    # НДС
-    story.append(Paragraph("В том числе НДС 20%: -", styles['ReceiptText']))
-    story.append(Paragraph("Согласно Упрощенной системе налогообложения", styles['ReceiptText']))
-
-    story.append(Spacer(1, 20))
-
-    # Печать
+def booking_document_tasks(kinds: tuple, filters: dict):
+    # Своя сессия, как у export_bookings_chunks; рендер - в воркерах пула, не больше их числа задач сразу
+    db = SessionLocal()
     try:
-        from reportlab.platypus import Image
-        stamp_path = "static/images/stamp.png"
-        if os.path.exists(stamp_path):
-            stamp = Image(stamp_path, width=80, height=80)
-            stamp.hAlign = 'RIGHT'
-            story.append(stamp)
-    except:
-        pass
+        for row in crud.iter_document_rows(db, filters):
+            for kind in kinds:
+                yield (kind, *row)
+    finally:
+        db.close()
 
-    # Подпись
-    story.append(Spacer(1, 10))
-    story.append(Paragraph("Подпись: _________________", styles['ReceiptText']))
 
-    doc.build(story)
-    buffer.seek(0)
+@app.get("/admin/render-stats")
+def admin_render_stats(user=Depends(require_admin)):
+    """Очередь и задержки рендера чеков и заявлений"""
+    return JSONResponse(render_pool.pool.stats())
 
-    filename = f"chek_{data['quest_title']}.pdf"
-    encoded_filename = urllib.parse.quote(filename)
 
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
-    )
+@app.get("/admin/hash-stats")
+def admin_hash_stats(user=Depends(require_admin)):
+    """Очередь и задержки bcrypt при входе и регистрации"""
+    return JSONResponse(hash_pool.stats())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+from sqlalchemy import text
+
+from models import QUEST_SEARCH_VECTOR_SQL
+
+# Идемпотентные миграции для уже существующих баз.
+# Base.metadata.create_all создаёт только отсутствующие таблицы,
+# поэтому новые колонки и индексы для старых таблиц добавляются здесь.
+MIGRATIONS = [
+    # Поисковый вектор по названию, описанию и жанру + GIN индекс
+    f"""
+    ALTER TABLE quests ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS ({QUEST_SEARCH_VECTOR_SQL}) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_quests_search_vector ON quests USING gin (search_vector)",
+    # Ключи keyset-пагинации каталога
+    "CREATE INDEX IF NOT EXISTS ix_quests_title_id ON quests (title, id)",
+    "CREATE INDEX IF NOT EXISTS ix_quests_price_id ON quests (price, id)",
+    # Перенос жанров из строки 'a, b' в таблицу quest_genres
+    """
+    INSERT INTO quest_genres (quest_id, genre)
+    SELECT DISTINCT q.id, trim(g.genre)
+    FROM quests q, unnest(string_to_array(q.genre, ',')) AS g(genre)
+    WHERE trim(g.genre) <> ''
+      AND NOT EXISTS (SELECT 1 FROM quest_genres qg WHERE qg.quest_id = q.id)
+    ON CONFLICT DO NOTHING
+    """,
+    # Время брони как timestamp. Повторные брони одного слота (гонка старого кода)
+    # оставляем без starts_at, чтобы не удалять данные и не нарушить уникальный индекс
+    "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS starts_at timestamp",
+    r"""
+    UPDATE bookings b
+    SET starts_at = CAST(b.date_time AS timestamp)
+    WHERE b.starts_at IS NULL
+      AND b.date_time ~ '^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$'
+      AND NOT EXISTS (
+          SELECT 1 FROM bookings other
+          WHERE other.quest_id = b.quest_id
+            AND other.date_time = b.date_time
+            AND other.id < b.id
+      )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_bookings_quest_starts_at ON bookings (quest_id, starts_at)",
+    # Сортировка и фильтры списка броней в админке
+    "CREATE INDEX IF NOT EXISTS ix_bookings_starts_at_id ON bookings (starts_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_bookings_user_starts_at ON bookings (user_id, starts_at)",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username) text_pattern_ops)",
+    # Первичное заполнение свёрток статистики (дальше их ведёт crud при записи броней)
+    """
+    INSERT INTO quest_day_stats (quest_id, day, bookings)
+    SELECT quest_id, starts_at::date, count(*)
+    FROM bookings
+    WHERE starts_at IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM quest_day_stats)
+    GROUP BY quest_id, starts_at::date
+    """,
+    """
+    INSERT INTO slot_day_stats (day, timeslot, bookings)
+    SELECT starts_at::date, to_char(starts_at, 'HH24:MI'), count(*)
+    FROM bookings
+    WHERE starts_at IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM slot_day_stats)
+    GROUP BY starts_at::date, to_char(starts_at, 'HH24:MI')
+    """,
+]
+
+
+def run_migrations(engine):
+    """Применяет все миграции в одной транзакции"""
+    with engine.begin() as conn:
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
@@ -1,7 +1,15 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Text, ForeignKey, Computed, Index, PrimaryKeyConstraint, DateTime, Date, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from database import Base
 
+# Поисковый вектор квеста: название важнее жанра, жанр важнее описания
+QUEST_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(genre, '')), 'B') || "
+    "setweight(to_tsvector('russian'::regconfig, coalesce(description, '')), 'C')"
+)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -12,6 +20,12 @@ class User(Base):
 
     bookings = relationship("Booking", back_populates="user")
 
+    __table_args__ = (
+        # Поиск по началу имени без учёта регистра: lower(username) LIKE 'префикс%'
+        Index("ix_users_username_lower", func.lower(username).label("username_lower"),
+              postgresql_ops={"username_lower": "text_pattern_ops"}),
+    )
+
 class Quest(Base):
     __tablename__ = "quests"
     id = Column(Integer, primary_key=True, index=True)
@@ -24,15 +38,69 @@ class Quest(Base):
     price = Column(Integer, nullable=False, default=2000)  # Добавлено поле цены
     organizer_email = Column(String(120), nullable=False, default="alibi@mail.ru")  # Email организатора
     image_path = Column(String(255), nullable=True)
+    search_vector = Column(TSVECTOR, Computed(QUEST_SEARCH_VECTOR_SQL, persisted=True))
 
     bookings = relationship("Booking", back_populates="quest")
+    genre_tags = relationship("QuestGenre", back_populates="quest", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_quests_search_vector", "search_vector", postgresql_using="gin"),
+        # Ключи keyset-пагинации каталога
+        Index("ix_quests_title_id", "title", "id"),
+        Index("ix_quests_price_id", "price", "id"),
+    )
+
+class QuestGenre(Base):
+    """Жанры квеста в нормализованном виде (Quest.genre остаётся строкой для отображения)"""
+    __tablename__ = "quest_genres"
+    quest_id = Column(Integer, ForeignKey("quests.id", ondelete="CASCADE"), nullable=False)
+    genre = Column(String(50), nullable=False)
+
+    quest = relationship("Quest", back_populates="genre_tags")
+
+    __table_args__ = (
+        PrimaryKeyConstraint("quest_id", "genre"),
+        Index("ix_quest_genres_genre_quest", "genre", "quest_id"),
+    )
 
 class Booking(Base):
     __tablename__ = "bookings"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     quest_id = Column(Integer, ForeignKey("quests.id"))
-    date_time = Column(String(50))
+    date_time = Column(String(50))  # 'YYYY-MM-DD HH:MM' для отображения
+    starts_at = Column(DateTime, nullable=True)  # начало слота, по нему проверяется занятость
 
     user = relationship("User", back_populates="bookings")
-    quest = relationship("Quest", back_populates="bookings")
\ No newline at end of file
+    quest = relationship("Quest", back_populates="bookings")
+
+    __table_args__ = (
+        # Один слот квеста - одна бронь; индекс же обслуживает выборки по диапазону дат
+        Index("ux_bookings_quest_starts_at", "quest_id", "starts_at", unique=True),
+        # Сортировка и фильтры списка броней в админке
+        Index("ix_bookings_starts_at_id", "starts_at", "id"),
+        Index("ix_bookings_user_starts_at", "user_id", "starts_at"),
+    )
+
+class QuestDayStats(Base):
+    """Свёртка броней: количество броней квеста за день (ведётся при записи броней)"""
+    __tablename__ = "quest_day_stats"
+    quest_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    bookings = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("quest_id", "day"),
+        Index("ix_quest_day_stats_day", "day"),
+    )
+
+class SlotDayStats(Base):
+    """Свёртка броней: количество броней на сеанс (время) за день по всем квестам"""
+    __tablename__ = "slot_day_stats"
+    day = Column(Date, nullable=False)
+    timeslot = Column(String(5), nullable=False)
+    bookings = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("day", "timeslot"),
+    )
@@ -0,0 +1,12 @@
+import os
+
+from bounded_pool import BoundedPool
+
+# "process" - ReportLab и python-docx нагружают CPU и держат GIL, поэтому по умолчанию отдельные процессы;
+# "thread" - запасной вариант (например, для отладки)
+RENDER_POOL_KIND = os.environ.get("QUEST_RENDER_POOL", "process")
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+# Сколько документов может ждать и выполняться одновременно; сверх этого - отказ (503)
+RENDER_QUEUE_LIMIT = 32
+
+pool = BoundedPool(workers=RENDER_WORKERS, queue_limit=RENDER_QUEUE_LIMIT, kind=RENDER_POOL_KIND, name="render")
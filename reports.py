@@ -0,0 +1,429 @@
+import io
+import zipfile
+from datetime import datetime
+from itertools import chain
+
+from docx import Document
+from docx.shared import Inches, Pt
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+# Потоковый лист пишется внутренними классами openpyxl (WorksheetWriter, ws._writer/_drawing):
+# версия закреплена в requirements.txt, совместимость проверяет tests/test_reports.py
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.writer.excel import ExcelWriter
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib import colors
+
+from assets import get_assets
+from exports import ChunkSink
+
+EXCEL_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXCEL_SHEET_TITLE = "Отчет по бронированиям"
+EXCEL_HEADERS = ['№', 'Пользователь', 'Email пользователя', 'Название квеста', 'Email организатора', 'Цена (руб)']
+EXCEL_COLUMN_WIDTHS = [8, 20, 25, 30, 25, 15]
+EXCEL_ROW_STYLES = ["report_cell_center", "report_cell", "report_cell", "report_cell", "report_cell",
+                    "report_cell_center"]
+
+# Лист пишется прямо в zip-запись: в write-only режиме всегда один лист, sheet1
+_SHEET_PATH = "xl/worksheets/sheet1.xml"
+
+
+def _report_styles():
+    """Именованные стили отчёта: регистрируются в книге один раз, ячейки ссылаются на них по имени"""
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    center = Alignment(horizontal='center', vertical='center')
+    left = Alignment(horizontal='left', vertical='center')
+    normal = Font(size=10)
+    bold = Font(bold=True, size=10)
+    total_fill = PatternFill(start_color="FFFFE0", end_color="FFFFE0", fill_type="solid")
+
+    return [
+        NamedStyle("report_company", font=Font(bold=True, size=18), alignment=center),
+        NamedStyle("report_text", font=normal, alignment=center),
+        NamedStyle("report_title", font=Font(bold=True, size=14), alignment=center),
+        NamedStyle("report_summary", font=bold, alignment=center),
+        NamedStyle("report_sign", alignment=center),
+        NamedStyle("report_head", font=bold, alignment=center, border=border,
+                   fill=PatternFill(start_color="E6E6FA", end_color="E6E6FA", fill_type="solid")),
+        NamedStyle("report_cell", alignment=left, border=border),
+        NamedStyle("report_cell_center", alignment=center, border=border),
+        NamedStyle("report_total_label", font=bold, border=border, fill=total_fill,
+                   alignment=Alignment(horizontal='right', vertical='center')),
+        NamedStyle("report_total", font=bold, alignment=center, border=border, fill=total_fill),
+    ]
+
+
+def _cell(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def _add_image(ws, name, anchor):
+    """Логотип/печать из реестра; без картинки или Pillow отчёт формируется без неё"""
+    try:
+        stream = get_assets().image_stream(name)
+        if stream is not None:
+            from openpyxl.drawing.image import Image as XLImage
+            image = XLImage(stream)
+            image.width = 80
+            image.height = 80
+            ws.add_image(image, anchor)
+    except Exception:
+        pass
+
+
+class _StreamedSheetExcelWriter(ExcelWriter):
+    """ExcelWriter для листа, уже записанного в архив по мере добавления строк"""
+
+    def write_worksheet(self, ws):
+        ws._drawing = SpreadsheetDrawing()
+        ws._drawing.charts = ws._charts
+        ws._drawing.images = ws._images
+        ws._rels = ws._writer._rels
+        self.manifest.append(ws)
+
+
+def stream_bookings_excel(rows):
+    """
+    Отчёт по бронированиям в xlsx, отдаваемый кусками по мере формирования.
+    rows - итератор кортежей (пользователь, email, квест, email организатора, цена).
+    Память не зависит от числа строк: строки сразу сжимаются в zip, стили общие.
+    """
+    sink = ChunkSink()
+    archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    wb = Workbook(write_only=True)
+    for style in _report_styles():
+        wb.add_named_style(style)
+    ws = wb.create_sheet(EXCEL_SHEET_TITLE)
+
+    # Размеры колонок и строк шапки задаются до первой строки: write-only пишет их в начало листа
+    for i, width in enumerate(EXCEL_COLUMN_WIDTHS, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.sheet_format.defaultRowHeight = 18
+    ws.sheet_format.customHeight = True
+    for row in (1, 6, 10):
+        ws.row_dimensions[row].height = 25
+    for row in (5, 9):
+        ws.row_dimensions[row].height = 15
+
+    _add_image(ws, "logo", 'A1')
+
+    # Размер листа заранее неизвестен: без zip64 лист больше 2 ГБ оборвал бы выгрузку ошибкой
+    sheet = archive.open(_SHEET_PATH, "w", force_zip64=True)
+    ws._writer = WorksheetWriter(ws, out=sheet)
+    ws._writer.write_top()
+
+    # Шапка документа (смещаем из-за логотипа)
+    company = ["Алиби", "РОССИЯ, 125009, г.Москва, ул.Квестовая, д.88",
+               "Телефон: +7(999) 999-99-99", "e-mail: alibi@mail.ru"]
+    for row, text in enumerate(company, 1):
+        ws.append([None, None, None, _cell(ws, text, "report_company" if row == 1 else "report_text")])
+        ws.merged_cells.add(f"D{row}:F{row}")
+    ws.append([])
+
+    ws.append([_cell(ws, "ОТЧЕТ ПО БРОНИРОВАНИЯМ", "report_title")])
+    ws.merged_cells.add("A6:F6")
+    ws.append([_cell(ws, f"Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}", "report_text")])
+    ws.merged_cells.add("A7:F7")
+    ws.append([])
+    ws.append([])
+
+    ws.append([_cell(ws, header, "report_head") for header in EXCEL_HEADERS])
+    yield sink.take()
+
+    # Данные бронирований: ячейки строки создаются один раз, строка пишется сразу - меняются только значения
+    row_cells = [_cell(ws, None, style) for style in EXCEL_ROW_STYLES]
+    count = 0
+    total_revenue = 0
+    for count, (username, email, title, organizer_email, price) in enumerate(rows, 1):
+        values = (count, username, email or 'Не указан', title, organizer_email, price)
+        for cell, value in zip(row_cells, values):
+            cell.value = value
+        ws.append(row_cells)
+        total_revenue += price
+        chunk = sink.take()
+        if chunk:
+            yield chunk
+
+    # Итоговая строка
+    last_row = count + 11
+    ws.append([_cell(ws, "ИТОГО:", "report_total_label")]
+              + [_cell(ws, None, "report_total_label") for _ in range(4)]
+              + [_cell(ws, f"{total_revenue} руб", "report_total")])
+    ws.merged_cells.add(f"A{last_row}:E{last_row}")
+    ws.append([])
+
+    # Статистика
+    stats_row = last_row + 2
+    ws.append([_cell(ws, f"Всего бронирований: {count} | Общая выручка: {total_revenue} руб", "report_summary")])
+    ws.merged_cells.add(f"A{stats_row}:F{stats_row}")
+
+    # Печать справа внизу
+    _add_image(ws, "stamp", f"F{stats_row + 4}")
+
+    # Место для подписи
+    sign_row = stats_row + 6
+    for _ in range(stats_row + 1, sign_row):
+        ws.append([])
+    ws.append([_cell(ws, "_________________________", "report_sign")])
+    ws.merged_cells.add(f"A{sign_row}:F{sign_row}")
+    ws.append([_cell(ws, "Подпись ответственного лица", "report_text")])
+    ws.merged_cells.add(f"A{sign_row + 1}:F{sign_row + 1}")
+
+    ws.close()
+    sheet.close()
+    # Остальные части книги (стили, картинки, связи) небольшие - дописываем стандартным писателем
+    _StreamedSheetExcelWriter(wb, archive).save()
+    yield sink.take()
+
+
+def build_bookings_excel(rows) -> bytes:
+    """Excel-отчёт целиком (для фоновых задач и кэша готовых отчётов)"""
+    return b"".join(stream_bookings_excel(rows))
+
+
+def build_bookings_pdf(rows) -> bytes:
+    """Отчёт по бронированиям в PDF с поддержкой кириллицы"""
+    buffer = io.BytesIO()
+
+    # Шрифты с кириллицей зарегистрированы при старте (assets.py)
+    assets = get_assets()
+    font_name = assets.font_name
+    bold_font_name = assets.bold_font_name
+
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=40,
+        leftMargin=40,
+        topMargin=60,
+        bottomMargin=40
+    )
+
+    styles = getSampleStyleSheet()
+
+    # Создаем кастомные стили для русского текста
+    styles.add(ParagraphStyle(name='Russian', fontName=font_name, fontSize=10, leading=12))
+    styles.add(ParagraphStyle(name='RussianBold', fontName=bold_font_name, fontSize=10, leading=12))
+    styles.add(ParagraphStyle(name='RussianTitle', fontName=bold_font_name, fontSize=16, leading=18,
+                              alignment=1))  # center
+    styles.add(ParagraphStyle(name='RussianHeading', fontName=bold_font_name, fontSize=14, leading=16,
+                              alignment=1))  # center
+
+    story = []
+
+    # Добавляем логотип
+    logo = assets.pdf_image("logo", 80, 80, hAlign='LEFT')
+    if logo is not None:
+        story.append(logo)
+        story.append(Spacer(1, 10))
+
+    # Шапка документа
+    story.append(Paragraph("Алиби", styles['RussianTitle']))
+    story.append(Paragraph("РОССИЯ, 125009, г.Москва, ул.Квестовая, д.88", styles['Russian']))
+    story.append(Paragraph("Телефон: +7(999) 999-99-99", styles['Russian']))
+    story.append(Paragraph("e-mail: alibi@mail.ru", styles['Russian']))
+    story.append(Spacer(1, 12))
+
+    # Заголовок отчета
+    story.append(Paragraph("ОТЧЕТ ПО БРОНИРОВАНИЯМ", styles['RussianHeading']))
+    story.append(Paragraph(f"Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}", styles['Russian']))
+    story.append(Spacer(1, 20))
+
+    # Таблица с данными
+    data = [['№', 'Пользователь', 'Квест', 'Цена (руб)']]
+    total_revenue = 0
+    for i, (username, _, title, _, price) in enumerate(rows, 1):
+        data.append([str(i), username or 'Не указан', title, f"{price} руб"])
+        total_revenue += price
+
+    if len(data) > 1:
+        table = Table(data, colWidths=[30, 120, 200, 60])
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#E6E6FA')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('ALIGN', (1, 1), (2, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), bold_font_name),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('FONTNAME', (0, 1), (-1, -1), font_name),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+
+        story.append(table)
+        story.append(Spacer(1, 20))
+
+        # Итоги
+        story.append(Paragraph(f"Всего бронирований: {len(data) - 1}", styles['RussianBold']))
+        story.append(Paragraph(f"Общая выручка: {total_revenue} руб", styles['RussianBold']))
+    else:
+        story.append(Paragraph("Нет данных о бронированиях", styles['Russian']))
+
+    story.append(Spacer(1, 30))
+
+    # Добавляем печать
+    stamp = assets.pdf_image("stamp", 80, 80, hAlign='RIGHT')
+    if stamp is not None:
+        story.append(stamp)
+
+    # Подпись
+    story.append(Spacer(1, 10))
+    story.append(Paragraph("_________________________", styles['Russian']))
+    story.append(Paragraph("Подпись ответственного лица", styles['Russian']))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def build_bookings_docx(rows) -> bytes:
+    """Отчёт по бронированиям в Word с логотипом и печатью"""
+    doc = Document()
+
+    # Настройка стилей
+    style = doc.styles['Normal']
+    font = style.font
+    font.name = 'Arial'
+    font.size = Pt(10)
+
+    # Создаем таблицу для шапки с логотипом
+    header_table = doc.add_table(rows=1, cols=2)
+    header_table.autofit = False
+    header_table.columns[0].width = Inches(1.5)
+    header_table.columns[1].width = Inches(4.5)
+
+    # Добавляем логотип в первую ячейку
+    assets = get_assets()
+    try:
+        logo = assets.image_stream("logo")
+        if logo is not None:
+            logo_run = header_table.cell(0, 0).paragraphs[0].add_run()
+            logo_run.add_picture(logo, width=Inches(1.8), height=Inches(1.8))
+    except:
+        pass
+
+    # Добавляем информацию во вторую ячейку
+    info_cell = header_table.cell(0, 1)
+    info_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+    info_cell.paragraphs[0].add_run("Алиби\n").bold = True
+    info_cell.paragraphs[0].add_run("РОССИЯ, 125009, г.Москва, ул.Квестовая, д.88\n")
+    info_cell.paragraphs[0].add_run("Телефон: +7(999) 999-99-99\n")
+    info_cell.paragraphs[0].add_run("e-mail: alibi@mail.ru")
+
+    doc.add_paragraph()
+
+    # Заголовок отчета
+    report_title = doc.add_paragraph("ОТЧЕТ ПО БРОНИРОВАНИЯМ")
+    report_title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    report_title.runs[0].bold = True
+    report_title.runs[0].font.size = Pt(14)
+
+    # Дата формирования
+    date_para = doc.add_paragraph(f"Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}")
+    date_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    doc.add_paragraph()
+
+    # Таблица с данными
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is not None:
+        table = doc.add_table(rows=1, cols=4)
+        table.style = 'Table Grid'
+        table.autofit = False
+        table.columns[0].width = Inches(0.5)   # №
+        table.columns[1].width = Inches(1.5)   # Пользователь
+        table.columns[2].width = Inches(2.5)   # Квест
+        table.columns[3].width = Inches(1.0)   # Цена
+
+        # Заголовки таблицы
+        headers = ['№', 'Пользователь', 'Квест', 'Цена (руб)']
+        hdr_cells = table.rows[0].cells
+        for i, header in enumerate(headers):
+            hdr_cells[i].text = header
+            hdr_cells[i].paragraphs[0].runs[0].bold = True
+            hdr_cells[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+            # Заливаем фон заголовков
+            shading_elm = parse_xml(r'<w:shd {} w:fill="E6E6FA"/>'.format(nsdecls('w')))
+            hdr_cells[i]._tc.get_or_add_tcPr().append(shading_elm)
+
+        # Данные
+        total_revenue = 0
+        for count, (username, _, title, _, price) in enumerate(chain([first], rows), 1):
+            row_cells = table.add_row().cells
+            row_cells[0].text = str(count)
+            row_cells[0].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+            row_cells[1].text = username or 'Не указан'
+            row_cells[2].text = title
+
+            row_cells[3].text = str(price)
+            row_cells[3].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+            total_revenue += price
+
+        doc.add_paragraph()
+
+        # Итоги
+        total_para = doc.add_paragraph()
+        total_para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+        total_para.add_run(f"ИТОГО: {total_revenue} руб\n").bold = True
+        total_para.add_run(f"Всего бронирований: {count} | Общая выручка: {total_revenue} руб").bold = True
+    else:
+        doc.add_paragraph("Нет данных о бронированиях")
+
+    doc.add_paragraph()
+    doc.add_paragraph()
+
+    # Создаем таблицу для подписи и печати
+    footer_table = doc.add_table(rows=1, cols=2)
+    footer_table.autofit = False
+    footer_table.columns[0].width = Inches(4.0)
+    footer_table.columns[1].width = Inches(2.0)
+
+    # Подпись в левой ячейке
+    sign_cell = footer_table.cell(0, 0)
+    sign_cell.paragraphs[0].add_run("_________________________\n")
+    sign_cell.paragraphs[0].add_run("Подпись ответственного лица")
+
+    # Печать в правой ячейке
+    try:
+        stamp = assets.image_stream("stamp")
+        if stamp is not None:
+            stamp_paragraph = footer_table.cell(0, 1).paragraphs[0]
+            stamp_paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+            stamp_paragraph.add_run().add_picture(stamp, width=Inches(1.8), height=Inches(1.8))
+    except:
+        pass
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+# Форматы отчётов: построитель, MIME-тип, расширение файла
+REPORT_FORMATS = {
+    "excel": (build_bookings_excel, EXCEL_MEDIA_TYPE, "xlsx"),
+    "pdf": (build_bookings_pdf, "application/pdf", "pdf"),
+    "word": (build_bookings_docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx"),
+}
+
+
+def report_filename(report_format: str) -> str:
+    extension = REPORT_FORMATS[report_format][2]
+    return f"otchet_bronirovaniya_{datetime.now().strftime('%Y%m%d_%H%M')}.{extension}"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import Optional, List
 
 class UserCreate(BaseModel):
     username: str
@@ -31,6 +31,8 @@ class QuestCreate(QuestBase):
 
 class QuestOut(QuestBase):
     id: int
+    price: int
+    organizer_email: Optional[str] = None
     image_path: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
@@ -41,3 +43,8 @@ class BookingCreate(BaseModel):
     timeslot: str
 
     model_config = ConfigDict(from_attributes=True)
+
+class BookingBatchCreate(BaseModel):
+    slots: List[BookingCreate]
+
+    model_config = ConfigDict(from_attributes=True)
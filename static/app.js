@@ -4,9 +4,9 @@ document.addEventListener("DOMContentLoaded", function() {
   if (loadBtn) {
     loadBtn.addEventListener("click", async () => {
       const btn = loadBtn;
-      const skip = parseInt(btn.dataset.skip || "0");
       const params = new URLSearchParams(window.location.search);
-      params.set("skip", skip);
+      params.delete("skip");
+      params.set("cursor", btn.dataset.cursor || "");
 
       const url = "/api/quests?" + params.toString();
       btn.disabled = true;
@@ -26,14 +26,14 @@ document.addEventListener("DOMContentLoaded", function() {
             const newCards = newGrid.innerHTML;
             cardsGrid.insertAdjacentHTML('beforeend', newCards);
 
-            const addedCount = (newGrid.innerHTML.match(/class="card"/g) || []).length;
-            const newSkip = skip + addedCount;
-            btn.dataset.skip = newSkip;
+            // Курсор следующей страницы приходит в заголовке
+            const nextCursor = res.headers.get("X-Next-Cursor");
             btn.textContent = "Посмотреть ещё";
             btn.disabled = false;
 
-            // Скрываем кнопку если загружено меньше чем лимит
-            if (addedCount === 0 || addedCount < 15) {
+            if (nextCursor) {
+              btn.dataset.cursor = nextCursor;
+            } else {
               btn.style.display = 'none';
             }
           } else {
@@ -0,0 +1,28 @@
+import pymupdf
+import pytest
+
+documents = pytest.importorskip("documents")
+
+
+def page_text(pdf: bytes) -> str:
+    return pymupdf.open(stream=pdf, filetype="pdf")[0].get_text()
+
+
+@pytest.mark.parametrize("quest_title, quest_price, client_name", [
+    ("Квест «Тайна» №5", 2500, "Иван Петров"),
+    ("Escape Room", 990, "user_42"),
+])
+def test_letterhead_text_matches_full_render(quest_title, quest_price, client_name):
+    letterhead = documents.receipt_letterhead()
+    assert letterhead is not None
+    lines = documents._receipt_lines(quest_title, quest_price, client_name)
+
+    pdf = letterhead.render(lines)
+    assert pdf is not None
+    assert page_text(pdf) == page_text(documents._render_receipt_full(lines))
+
+
+def test_letterhead_falls_back_for_markup():
+    letterhead = documents.receipt_letterhead()
+    lines = documents._receipt_lines("<b>Квест</b>", 2500, "client")
+    assert letterhead.render(lines) is None
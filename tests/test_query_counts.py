@@ -0,0 +1,108 @@
+"""
+Число SQL-запросов на страницу не должно расти с числом строк (N+1).
+Нужна база из database.py; тест создаёт свои квесты, пользователей и брони и удаляет их после себя.
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+PASSWORD = "query-count"
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    try:
+        import main
+    except ImportError:
+        raise
+    except Exception as e:  # база недоступна
+        pytest.skip(f"Нет подключения к базе: {e}")
+    return main
+
+
+@pytest.fixture(scope="module")
+def data(app_module):
+    import models
+    from auth import hash_password
+    from database import SessionLocal
+
+    prefix = f"qc{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    try:
+        admin = models.User(username=f"{prefix}admin", hashed_password=hash_password(PASSWORD), is_admin=True)
+        users = [models.User(username=f"{prefix}user{i}", email=f"{prefix}{i}@example.com",
+                             hashed_password="-", is_admin=False) for i in range(12)]
+        quests = [models.Quest(title=f"{prefix} квест {i}", description="Описание", genre="Хоррор, Детектив",
+                               difficulty="Средняя", fear_level=3, players=4, price=2000 + i)
+                  for i in range(12)]
+        db.add_all([admin, *users, *quests])
+        db.flush()
+        for quest in quests:
+            quest.genre_tags = [models.QuestGenre(genre="Хоррор"), models.QuestGenre(genre="Детектив")]
+        # Все брони - у админа (для /my-bookings) и по одной у каждого пользователя (для /admin/bookings)
+        start = datetime(2099, 1, 1, 10, 0)
+        bookings = []
+        for i, quest in enumerate(quests):
+            for j, user in enumerate((admin, users[i])):
+                starts_at = start + timedelta(days=i, hours=2 * j)
+                bookings.append(models.Booking(user_id=user.id, quest_id=quest.id, starts_at=starts_at,
+                                               date_time=starts_at.strftime("%Y-%m-%d %H:%M")))
+        db.add_all(bookings)
+        db.commit()
+        yield {"prefix": prefix, "admin": admin.username, "quest_ids": [quest.id for quest in quests],
+               "user_ids": [admin.id] + [user.id for user in users]}
+    finally:
+        db.rollback()
+        db.query(models.Booking).filter(models.Booking.user_id.in_(
+            db.query(models.User.id).filter(models.User.username.startswith(prefix)))).delete(synchronize_session=False)
+        db.query(models.QuestGenre).filter(models.QuestGenre.quest_id.in_(
+            db.query(models.Quest.id).filter(models.Quest.title.startswith(prefix)))).delete(synchronize_session=False)
+        db.query(models.Quest).filter(models.Quest.title.startswith(prefix)).delete(synchronize_session=False)
+        db.query(models.User).filter(models.User.username.startswith(prefix)).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def client(app_module, data):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app_module.app) as client:
+        response = client.post("/login", data={"username": data["admin"], "password": PASSWORD},
+                               follow_redirects=False)
+        assert response.status_code == 303
+        yield client
+
+
+def query_count(client, url) -> int:
+    from cache import catalog_cache
+
+    catalog_cache.clear()  # считаем запросы без кэша выборок каталога
+    response = client.get(url)
+    assert response.status_code == 200, response.text
+    return int(response.headers["X-Query-Count"])
+
+
+def test_catalog_query_count_does_not_depend_on_page_size(client):
+    one = query_count(client, "/api/quests?limit=1")
+    many = query_count(client, "/api/quests?limit=12")
+    assert many == one
+    assert query_count(client, "/") <= 3
+    assert query_count(client, "/api/v1/quests?limit=12") <= 3
+
+
+def test_my_bookings_query_count(client, data):
+    # 12 броней разных квестов: квест каждой брони не догружается отдельным запросом
+    assert query_count(client, "/my-bookings") <= 3
+
+
+def test_admin_bookings_query_count_does_not_depend_on_rows(client, data):
+    prefix = data["prefix"]
+    one = query_count(client, f"/admin/bookings?user={prefix}user1")      # user1, user10, user11
+    many = query_count(client, f"/admin/bookings?user={prefix}")          # все 24 брони
+    assert many == one
+    assert many <= 5
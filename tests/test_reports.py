@@ -0,0 +1,44 @@
+import io
+import zipfile
+
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+reports = pytest.importorskip("reports")
+from assets import get_assets
+
+ROWS = [(f"user{i}", f"user{i}@example.com" if i % 3 else None, f"Квест {i % 5}", "org@example.com", 1000 + i)
+        for i in range(1, 26)]
+
+
+def test_streamed_excel_report_opens():
+    # reports.py пишет лист через внутренние классы openpyxl: тест ловит несовместимую версию
+    content = reports.build_bookings_excel(iter(ROWS))
+    wb = openpyxl.load_workbook(io.BytesIO(content))
+    ws = wb[reports.EXCEL_SHEET_TITLE]
+
+    assert [cell.value for cell in ws[10]] == reports.EXCEL_HEADERS
+    assert [cell.value for cell in ws[11]] == [1, "user1", "user1@example.com", "Квест 1", "org@example.com", 1001]
+    assert ws.cell(row=13, column=3).value == "Не указан"
+    assert ws.cell(row=10 + len(ROWS), column=2).value == f"user{len(ROWS)}"
+
+    total_row = 11 + len(ROWS)
+    assert ws.cell(row=total_row, column=1).value == "ИТОГО:"
+    assert ws.cell(row=total_row, column=6).value == f"{sum(row[4] for row in ROWS)} руб"
+    assert ws.cell(row=11, column=2).style == "report_cell"
+
+    merged = {str(cell_range) for cell_range in ws.merged_cells.ranges}
+    assert {"D1:F1", "A6:F6", f"A{total_row}:E{total_row}"} <= merged
+    assert ws.column_dimensions["D"].width == 30
+
+    # Логотип и печать - отдельные картинки в xl/media
+    expected_images = sum(get_assets().image_stream(name) is not None for name in ("logo", "stamp"))
+    media = [name for name in zipfile.ZipFile(io.BytesIO(content)).namelist() if name.startswith("xl/media/")]
+    assert len(media) == expected_images
+
+
+def test_streamed_excel_report_without_rows():
+    wb = openpyxl.load_workbook(io.BytesIO(reports.build_bookings_excel(iter(()))))
+    ws = wb[reports.EXCEL_SHEET_TITLE]
+    assert ws.cell(row=11, column=1).value == "ИТОГО:"
+    assert ws.cell(row=11, column=6).value == "0 руб"